@@ -0,0 +1,2 @@
+# Makes the repository root importable, so that the tests can import src with a
+# plain `pytest` run from the root.
@@ -1,626 +1,120 @@
+from functools import lru_cache
+
+import numpy as np
+
+# residues of the BLOSUM62 matrix, in the order of its rows and columns
+ALPHABET = "ARNDCQEGHILKMFPSTWYVBZX*"
+# code of the gap, right after the residues of ALPHABET
+GAP_CODE = len(ALPHABET)
+# number of codes in a profile: the residues of ALPHABET and the gap
+PROFILE_SIZE = GAP_CODE + 1
+
+# fmt: off
+BLOSUM62 = np.array(
+    [
+        [ 4, -1, -2, -2,  0, -1, -1,  0, -2, -1, -1, -1, -1, -2, -1,  1,  0, -3, -2,  0, -2, -1,  0, -4],  # A
+        [-1,  5,  0, -2, -3,  1,  0, -2,  0, -3, -2,  2, -1, -3, -2, -1, -1, -3, -2, -3, -1,  0, -1, -4],  # R
+        [-2,  0,  6,  1, -3,  0,  0,  0,  1, -3, -3,  0, -2, -3, -2,  1,  0, -4, -2, -3,  3,  0, -1, -4],  # N
+        [-2, -2,  1,  6, -3,  0,  2, -1, -1, -3, -4, -1, -3, -3, -1,  0, -1, -4, -3, -3,  4,  1, -1, -4],  # D
+        [ 0, -3, -3, -3,  9, -3, -4, -3, -3, -1, -1, -3, -1, -2, -3, -1, -1, -2, -2, -1, -3, -3, -2, -4],  # C
+        [-1,  1,  0,  0, -3,  5,  2, -2,  0, -3, -2,  1,  0, -3, -1,  0, -1, -2, -1, -2,  0,  3, -1, -4],  # Q
+        [-1,  0,  0,  2, -4,  2,  5, -2,  0, -3, -3,  1, -2, -3, -1,  0, -1, -3, -2, -2,  1,  4, -1, -4],  # E
+        [ 0, -2,  0, -1, -3, -2, -2,  6, -2, -4, -4, -2, -3, -3, -2,  0, -2, -2, -3, -3, -1, -2, -1, -4],  # G
+        [-2,  0,  1, -1, -3,  0,  0, -2,  8, -3, -3, -1, -2, -1, -2, -1, -2, -2,  2, -3,  0,  0, -1, -4],  # H
+        [-1, -3, -3, -3, -1, -3, -3, -4, -3,  4,  2, -3,  1,  0, -3, -2, -1, -3, -1,  3, -3, -3, -1, -4],  # I
+        [-1, -2, -3, -4, -1, -2, -3, -4, -3,  2,  4, -2,  2,  0, -3, -2, -1, -2, -1,  1, -4, -3, -1, -4],  # L
+        [-1,  2,  0, -1, -3,  1,  1, -2, -1, -3, -2,  5, -1, -3, -1,  0, -1, -3, -2, -2,  0,  1, -1, -4],  # K
+        [-1, -1, -2, -3, -1,  0, -2, -3, -2,  1,  2, -1,  5,  0, -2, -1, -1, -1, -1,  1, -3, -1, -1, -4],  # M
+        [-2, -3, -3, -3, -2, -3, -3, -3, -1,  0,  0, -3,  0,  6, -4, -2, -2,  1,  3, -1, -3, -3, -1, -4],  # F
+        [-1, -2, -2, -1, -3, -1, -1, -2, -2, -3, -3, -1, -2, -4,  7, -1, -1, -4, -3, -2, -2, -1, -2, -4],  # P
+        [ 1, -1,  1,  0, -1,  0,  0,  0, -1, -2, -2,  0, -1, -2, -1,  4,  1, -3, -2, -2,  0,  0,  0, -4],  # S
+        [ 0, -1,  0, -1, -1, -1, -1, -2, -2, -1, -1, -1, -1, -2, -1,  1,  5, -2, -2,  0, -1, -1,  0, -4],  # T
+        [-3, -3, -4, -4, -2, -2, -3, -2, -2, -3, -2, -3, -1,  1, -4, -3, -2, 11,  2, -3, -4, -3, -2, -4],  # W
+        [-2, -2, -2, -3, -2, -1, -2, -3,  2, -1, -1, -2, -1,  3, -3, -2, -2,  2,  7, -1, -3, -2, -1, -4],  # Y
+        [ 0, -3, -3, -3, -1, -2, -2, -3, -3,  3,  1, -2,  1, -1, -2, -2,  0, -3, -1,  4, -3, -2, -1, -4],  # V
+        [-2, -1,  3,  4, -3,  0,  1, -1,  0, -3, -4,  0, -3, -3, -2,  0, -1, -4, -3, -3,  4,  1, -1, -4],  # B
+        [-1,  0,  0,  1, -3,  3,  4, -2,  0, -3, -3,  1, -1, -3, -1,  0, -1, -3, -2, -2,  1,  4, -1, -4],  # Z
+        [ 0, -1, -1, -1, -2, -1, -1, -1, -1, -1, -1, -1, -1, -1, -2,  0,  0, -2, -1, -1, -1, -1, -1, -4],  # X
+        [-4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4,  1],  # *
+    ],
+    dtype=np.int64,
+)
+# fmt: on
+BLOSUM62.setflags(write=False)
+
+# dict of dict view of BLOSUM62, BLOSUM["A"]["R"] is the score of A against R
 BLOSUM = {
-    "*": {
-        "*": 1,
-        "A": -4,
-        "C": -4,
-        "B": -4,
-        "E": -4,
-        "D": -4,
-        "G": -4,
-        "F": -4,
-        "I": -4,
-        "H": -4,
-        "K": -4,
-        "M": -4,
-        "L": -4,
-        "N": -4,
-        "Q": -4,
-        "P": -4,
-        "S": -4,
-        "R": -4,
-        "T": -4,
-        "W": -4,
-        "V": -4,
-        "Y": -4,
-        "X": -4,
-        "Z": -4,
-    },
-    "A": {
-        "*": -4,
-        "A": 4,
-        "C": 0,
-        "B": -2,
-        "E": -1,
-        "D": -2,
-        "G": 0,
-        "F": -2,
-        "I": -1,
-        "H": -2,
-        "K": -1,
-        "M": -1,
-        "L": -1,
-        "N": -2,
-        "Q": -1,
-        "P": -1,
-        "S": 1,
-        "R": -1,
-        "T": 0,
-        "W": -3,
-        "V": 0,
-        "Y": -2,
-        "X": 0,
-        "Z": -1,
-    },
-    "C": {
-        "*": -4,
-        "A": 0,
-        "C": 9,
-        "B": -3,
-        "E": -4,
-        "D": -3,
-        "G": -3,
-        "F": -2,
-        "I": -1,
-        "H": -3,
-        "K": -3,
-        "M": -1,
-        "L": -1,
-        "N": -3,
-        "Q": -3,
-        "P": -3,
-        "S": -1,
-        "R": -3,
-        "T": -1,
-        "W": -2,
-        "V": -1,
-        "Y": -2,
-        "X": -2,
-        "Z": -3,
-    },
-    "B": {
-        "*": -4,
-        "A": -2,
-        "C": -3,
-        "B": 4,
-        "E": 1,
-        "D": 4,
-        "G": -1,
-        "F": -3,
-        "I": -3,
-        "H": 0,
-        "K": 0,
-        "M": -3,
-        "L": -4,
-        "N": 3,
-        "Q": 0,
-        "P": -2,
-        "S": 0,
-        "R": -1,
-        "T": -1,
-        "W": -4,
-        "V": -3,
-        "Y": -3,
-        "X": -1,
-        "Z": 1,
-    },
-    "E": {
-        "*": -4,
-        "A": -1,
-        "C": -4,
-        "B": 1,
-        "E": 5,
-        "D": 2,
-        "G": -2,
-        "F": -3,
-        "I": -3,
-        "H": 0,
-        "K": 1,
-        "M": -2,
-        "L": -3,
-        "N": 0,
-        "Q": 2,
-        "P": -1,
-        "S": 0,
-        "R": 0,
-        "T": -1,
-        "W": -3,
-        "V": -2,
-        "Y": -2,
-        "X": -1,
-        "Z": 4,
-    },
-    "D": {
-        "*": -4,
-        "A": -2,
-        "C": -3,
-        "B": 4,
-        "E": 2,
-        "D": 6,
-        "G": -1,
-        "F": -3,
-        "I": -3,
-        "H": -1,
-        "K": -1,
-        "M": -3,
-        "L": -4,
-        "N": 1,
-        "Q": 0,
-        "P": -1,
-        "S": 0,
-        "R": -2,
-        "T": -1,
-        "W": -4,
-        "V": -3,
-        "Y": -3,
-        "X": -1,
-        "Z": 1,
-    },
-    "G": {
-        "*": -4,
-        "A": 0,
-        "C": -3,
-        "B": -1,
-        "E": -2,
-        "D": -1,
-        "G": 6,
-        "F": -3,
-        "I": -4,
-        "H": -2,
-        "K": -2,
-        "M": -3,
-        "L": -4,
-        "N": 0,
-        "Q": -2,
-        "P": -2,
-        "S": 0,
-        "R": -2,
-        "T": -2,
-        "W": -2,
-        "V": -3,
-        "Y": -3,
-        "X": -1,
-        "Z": -2,
-    },
-    "F": {
-        "*": -4,
-        "A": -2,
-        "C": -2,
-        "B": -3,
-        "E": -3,
-        "D": -3,
-        "G": -3,
-        "F": 6,
-        "I": 0,
-        "H": -1,
-        "K": -3,
-        "M": 0,
-        "L": 0,
-        "N": -3,
-        "Q": -3,
-        "P": -4,
-        "S": -2,
-        "R": -3,
-        "T": -2,
-        "W": 1,
-        "V": -1,
-        "Y": 3,
-        "X": -1,
-        "Z": -3,
-    },
-    "I": {
-        "*": -4,
-        "A": -1,
-        "C": -1,
-        "B": -3,
-        "E": -3,
-        "D": -3,
-        "G": -4,
-        "F": 0,
-        "I": 4,
-        "H": -3,
-        "K": -3,
-        "M": 1,
-        "L": 2,
-        "N": -3,
-        "Q": -3,
-        "P": -3,
-        "S": -2,
-        "R": -3,
-        "T": -1,
-        "W": -3,
-        "V": 3,
-        "Y": -1,
-        "X": -1,
-        "Z": -3,
-    },
-    "H": {
-        "*": -4,
-        "A": -2,
-        "C": -3,
-        "B": 0,
-        "E": 0,
-        "D": -1,
-        "G": -2,
-        "F": -1,
-        "I": -3,
-        "H": 8,
-        "K": -1,
-        "M": -2,
-        "L": -3,
-        "N": 1,
-        "Q": 0,
-        "P": -2,
-        "S": -1,
-        "R": 0,
-        "T": -2,
-        "W": -2,
-        "V": -3,
-        "Y": 2,
-        "X": -1,
-        "Z": 0,
-    },
-    "K": {
-        "*": -4,
-        "A": -1,
-        "C": -3,
-        "B": 0,
-        "E": 1,
-        "D": -1,
-        "G": -2,
-        "F": -3,
-        "I": -3,
-        "H": -1,
-        "K": 5,
-        "M": -1,
-        "L": -2,
-        "N": 0,
-        "Q": 1,
-        "P": -1,
-        "S": 0,
-        "R": 2,
-        "T": -1,
-        "W": -3,
-        "V": -2,
-        "Y": -2,
-        "X": -1,
-        "Z": 1,
-    },
-    "M": {
-        "*": -4,
-        "A": -1,
-        "C": -1,
-        "B": -3,
-        "E": -2,
-        "D": -3,
-        "G": -3,
-        "F": 0,
-        "I": 1,
-        "H": -2,
-        "K": -1,
-        "M": 5,
-        "L": 2,
-        "N": -2,
-        "Q": 0,
-        "P": -2,
-        "S": -1,
-        "R": -1,
-        "T": -1,
-        "W": -1,
-        "V": 1,
-        "Y": -1,
-        "X": -1,
-        "Z": -1,
-    },
-    "L": {
-        "*": -4,
-        "A": -1,
-        "C": -1,
-        "B": -4,
-        "E": -3,
-        "D": -4,
-        "G": -4,
-        "F": 0,
-        "I": 2,
-        "H": -3,
-        "K": -2,
-        "M": 2,
-        "L": 4,
-        "N": -3,
-        "Q": -2,
-        "P": -3,
-        "S": -2,
-        "R": -2,
-        "T": -1,
-        "W": -2,
-        "V": 1,
-        "Y": -1,
-        "X": -1,
-        "Z": -3,
-    },
-    "N": {
-        "*": -4,
-        "A": -2,
-        "C": -3,
-        "B": 3,
-        "E": 0,
-        "D": 1,
-        "G": 0,
-        "F": -3,
-        "I": -3,
-        "H": 1,
-        "K": 0,
-        "M": -2,
-        "L": -3,
-        "N": 6,
-        "Q": 0,
-        "P": -2,
-        "S": 1,
-        "R": 0,
-        "T": 0,
-        "W": -4,
-        "V": -3,
-        "Y": -2,
-        "X": -1,
-        "Z": 0,
-    },
-    "Q": {
-        "*": -4,
-        "A": -1,
-        "C": -3,
-        "B": 0,
-        "E": 2,
-        "D": 0,
-        "G": -2,
-        "F": -3,
-        "I": -3,
-        "H": 0,
-        "K": 1,
-        "M": 0,
-        "L": -2,
-        "N": 0,
-        "Q": 5,
-        "P": -1,
-        "S": 0,
-        "R": 1,
-        "T": -1,
-        "W": -2,
-        "V": -2,
-        "Y": -1,
-        "X": -1,
-        "Z": 3,
-    },
-    "P": {
-        "*": -4,
-        "A": -1,
-        "C": -3,
-        "B": -2,
-        "E": -1,
-        "D": -1,
-        "G": -2,
-        "F": -4,
-        "I": -3,
-        "H": -2,
-        "K": -1,
-        "M": -2,
-        "L": -3,
-        "N": -2,
-        "Q": -1,
-        "P": 7,
-        "S": -1,
-        "R": -2,
-        "T": -1,
-        "W": -4,
-        "V": -2,
-        "Y": -3,
-        "X": -2,
-        "Z": -1,
-    },
-    "S": {
-        "*": -4,
-        "A": 1,
-        "C": -1,
-        "B": 0,
-        "E": 0,
-        "D": 0,
-        "G": 0,
-        "F": -2,
-        "I": -2,
-        "H": -1,
-        "K": 0,
-        "M": -1,
-        "L": -2,
-        "N": 1,
-        "Q": 0,
-        "P": -1,
-        "S": 4,
-        "R": -1,
-        "T": 1,
-        "W": -3,
-        "V": -2,
-        "Y": -2,
-        "X": 0,
-        "Z": 0,
-    },
-    "R": {
-        "*": -4,
-        "A": -1,
-        "C": -3,
-        "B": -1,
-        "E": 0,
-        "D": -2,
-        "G": -2,
-        "F": -3,
-        "I": -3,
-        "H": 0,
-        "K": 2,
-        "M": -1,
-        "L": -2,
-        "N": 0,
-        "Q": 1,
-        "P": -2,
-        "S": -1,
-        "R": 5,
-        "T": -1,
-        "W": -3,
-        "V": -3,
-        "Y": -2,
-        "X": -1,
-        "Z": 0,
-    },
-    "T": {
-        "*": -4,
-        "A": 0,
-        "C": -1,
-        "B": -1,
-        "E": -1,
-        "D": -1,
-        "G": -2,
-        "F": -2,
-        "I": -1,
-        "H": -2,
-        "K": -1,
-        "M": -1,
-        "L": -1,
-        "N": 0,
-        "Q": -1,
-        "P": -1,
-        "S": 1,
-        "R": -1,
-        "T": 5,
-        "W": -2,
-        "V": 0,
-        "Y": -2,
-        "X": 0,
-        "Z": -1,
-    },
-    "W": {
-        "*": -4,
-        "A": -3,
-        "C": -2,
-        "B": -4,
-        "E": -3,
-        "D": -4,
-        "G": -2,
-        "F": 1,
-        "I": -3,
-        "H": -2,
-        "K": -3,
-        "M": -1,
-        "L": -2,
-        "N": -4,
-        "Q": -2,
-        "P": -4,
-        "S": -3,
-        "R": -3,
-        "T": -2,
-        "W": 11,
-        "V": -3,
-        "Y": 2,
-        "X": -2,
-        "Z": -3,
-    },
-    "V": {
-        "*": -4,
-        "A": 0,
-        "C": -1,
-        "B": -3,
-        "E": -2,
-        "D": -3,
-        "G": -3,
-        "F": -1,
-        "I": 3,
-        "H": -3,
-        "K": -2,
-        "M": 1,
-        "L": 1,
-        "N": -3,
-        "Q": -2,
-        "P": -2,
-        "S": -2,
-        "R": -3,
-        "T": 0,
-        "W": -3,
-        "V": 4,
-        "Y": -1,
-        "X": -1,
-        "Z": -2,
-    },
-    "Y": {
-        "*": -4,
-        "A": -2,
-        "C": -2,
-        "B": -3,
-        "E": -2,
-        "D": -3,
-        "G": -3,
-        "F": 3,
-        "I": -1,
-        "H": 2,
-        "K": -2,
-        "M": -1,
-        "L": -1,
-        "N": -2,
-        "Q": -1,
-        "P": -3,
-        "S": -2,
-        "R": -2,
-        "T": -2,
-        "W": 2,
-        "V": -1,
-        "Y": 7,
-        "X": -1,
-        "Z": -2,
-    },
-    "X": {
-        "*": -4,
-        "A": 0,
-        "C": -2,
-        "B": -1,
-        "E": -1,
-        "D": -1,
-        "G": -1,
-        "F": -1,
-        "I": -1,
-        "H": -1,
-        "K": -1,
-        "M": -1,
-        "L": -1,
-        "N": -1,
-        "Q": -1,
-        "P": -2,
-        "S": 0,
-        "R": -1,
-        "T": 0,
-        "W": -2,
-        "V": -1,
-        "Y": -1,
-        "X": -1,
-        "Z": -1,
-    },
-    "Z": {
-        "*": -4,
-        "A": -1,
-        "C": -3,
-        "B": 1,
-        "E": 4,
-        "D": 1,
-        "G": -2,
-        "F": -3,
-        "I": -3,
-        "H": 0,
-        "K": 1,
-        "M": -1,
-        "L": -3,
-        "N": 0,
-        "Q": 3,
-        "P": -1,
-        "S": 0,
-        "R": 0,
-        "T": -1,
-        "W": -3,
-        "V": -2,
-        "Y": -2,
-        "X": -1,
-        "Z": 4,
-    },
+    first: {second: int(score) for second, score in zip(ALPHABET, row)}
+    for first, row in zip(ALPHABET, BLOSUM62)
 }
+
+# ascii code -> residue code, the residues of ALPHABET first, then the gap,
+# then every other ascii character so that equal codes means equal characters
+ORDER = ALPHABET + "-" + "".join(
+    chr(i) for i in range(128) if chr(i) not in ALPHABET + "-"
+)
+CODES = np.zeros(128, dtype=np.uint8)
+CODES[[ord(character) for character in ORDER]] = np.arange(128)
+CHARACTERS = np.zeros(128, dtype=np.uint8)
+CHARACTERS[CODES] = np.arange(128)
+
+
+def encode(residues: str) -> np.ndarray:
+    """
+    The encode function converts residues to residue codes.
+
+    :param residues: The residues as a plain string
+    :return: A uint8 numpy array of codes
+    """
+    return CODES[np.frombuffer(residues.encode("ascii"), dtype=np.uint8)]
+
+
+def decode(codes: np.ndarray) -> str:
+    """
+    The decode function converts residue codes back to residues.
+
+    :param codes: A numpy array of codes
+    :return: The residues as a plain string
+    """
+    return CHARACTERS[codes].tobytes().decode("ascii")
+
+
+@lru_cache(maxsize=None)
+def scoreTable(match: int, mismatch: int, useBlosum: bool) -> np.ndarray:
+    """
+    The scoreTable function builds the score of a diagonal move for every pair of codes.
+    Without blosum it is match on equal codes and mismatch otherwise, with blosum the
+    scores between residues of ALPHABET come from BLOSUM62, the gap keeps match/mismatch.
+    Tables are cached and read only.
+
+    :param match: Score of a match
+    :param mismatch: Score of a mismatch
+    :param useBlosum: Determine whether the blosum matrix should be used or not
+    :return: A 128x128 numpy array indexed by codes
+    """
+    table = np.full((128, 128), mismatch, dtype=np.int64)
+    np.fill_diagonal(table, match)
+    if useBlosum:
+        table[:GAP_CODE, :GAP_CODE] = BLOSUM62
+    table.setflags(write=False)
+    return table
+
+
+@lru_cache(maxsize=None)
+def sumOfPairsTable(match: int, mismatch: int, useBlosum: bool, gap: int) -> np.ndarray:
+    """
+    The sumOfPairsTable function builds the score of two codes in a column of an alignment
+    scored by the sum of pairs: scoreTable between residues, gap between a residue and a gap
+    and 0 between two gaps. Tables are cached and read only.
+
+    :param match: Score of a match
+    :param mismatch: Score of a mismatch
+    :param useBlosum: Determine whether the blosum matrix should be used or not
+    :param gap: Score of a residue against a gap
+    :return: A 128x128 numpy array indexed by codes
+    """
+    table = scoreTable(match, mismatch, useBlosum).copy()
+    table[GAP_CODE, :] = table[:, GAP_CODE] = gap
+    table[GAP_CODE, GAP_CODE] = 0
+    table.setflags(write=False)
+    return table
@@ -1,11 +1,16 @@
 import itertools
 from dataclasses import dataclass
-from enum import Enum
+from enum import Enum, IntFlag
 from typing import List, Tuple, Union
 
-from .BLOSUM import BLOSUM
+import numpy as np
+
+from .BLOSUM import BLOSUM, GAP_CODE, PROFILE_SIZE, decode, scoreTable, sumOfPairsTable
 from .sequence import GroupSequences, Sequence
 
+# number of cells under which NWSHirschberg stops splitting and fills the whole matrix
+HIRSCHBERG_BLOCK = 1 << 16
+
 
 class Direction(Enum):
     UP = "up"
@@ -16,6 +21,63 @@ class Direction(Enum):
         return self.value
 
 
+class DirectionFlag(IntFlag):
+    """Bit flags used to store every optimal direction of a cell in a single uint8"""
+
+    DIAG = 1
+    UP = 2
+    LEFT = 4
+    STOP = 8
+    # affine gaps (GotohFill): the up or left gap ending in the cell extends a gap
+    EXTEND_UP = 16
+    EXTEND_LEFT = 32
+
+    @classmethod
+    def fromDirection(cls, direction: Union[Direction, None]) -> "DirectionFlag":
+        """
+        The fromDirection function returns the flag of a direction, None being the STOP flag.
+
+        :param direction: The direction returned by the alignment
+        :return: The matching flag
+        """
+        return cls.STOP if direction is None else cls[direction.name]
+
+    def toDirections(self) -> List[Union[Direction, None]]:
+        """
+        The toDirections function decodes the flags of a cell in the order the directions
+        are found by the alignment (diag, up, left, then None for STOP).
+
+        :param self: The flags of a cell
+        :return: The list of directions
+        """
+        return [
+            None if flag is DirectionFlag.STOP else Direction[flag.name]
+            for flag in DirectionFlag
+            if flag in self
+            and flag not in DirectionFlag.EXTEND_UP | DirectionFlag.EXTEND_LEFT
+        ]
+
+
+# direction followed by the backtracks from a cell, for every value of matDir
+# (the last optimal direction found by __bestAction: DIAG, then UP, then LEFT, then STOP)
+LAST_DIRECTION = tuple(
+    None
+    if flags & DirectionFlag.STOP
+    else Direction.LEFT
+    if flags & DirectionFlag.LEFT
+    else Direction.UP
+    if flags & DirectionFlag.UP
+    else Direction.DIAG
+    for flags in range(1 << len(DirectionFlag))
+)
+
+# bits of the directions returned by __bestAction, None being STOP, as plain integers
+DIRECTION_BITS = {
+    direction: int(DirectionFlag.fromDirection(direction))
+    for direction in (*Direction, None)
+}
+
+
 @dataclass
 class Coord(object):
     """Class coordinates for position in a matrix"""
@@ -38,6 +100,41 @@ class Coord(object):
         return f"({self.x}, {self.y})"
 
 
+class PairProfile(object):
+    """
+    Scores of every pair of columns of two groups of sequences, computed a row at a time
+    so that a profile alignment stays in the space of its matrices (see Alignment.__pairProfile)
+    """
+
+    def __init__(self, rows: np.ndarray, columns: np.ndarray) -> None:
+        # score of each row against each code, and counts of each code in each column,
+        # as floats for the speed of the products: their integer results are exact
+        self.rows = rows.astype(np.float64, copy=False)
+        self.columns = columns.astype(np.float64, copy=False)
+        self.shape = (len(rows), columns.shape[1])
+
+    def __getitem__(
+        self, key: Union[int, Tuple[Union[int, slice], Union[int, slice]]]
+    ) -> Union[np.ndarray, int, "PairProfile"]:
+        """
+        The __getitem__ function returns the scores of a row, profile[i], of some of its columns,
+        profile[i, columns], or the profile of some columns, profile[:, columns].
+
+        :param self: Reference the class itself
+        :param key: The row, or the row and the columns
+        :return: The scores, or the profile of the columns
+        """
+        if not isinstance(key, tuple):
+            return (self.rows[key] @ self.columns).astype(np.int64)
+        row, columns = key
+        if isinstance(row, slice):
+            # copied once, so that the products of its rows do not copy a strided view
+            return PairProfile(
+                self.rows[row], np.ascontiguousarray(self.columns[:, columns])
+            )
+        return (self.rows[row] @ self.columns[:, columns]).astype(np.int64)
+
+
 # # Type of alignment
 # Coord = Tuple[int, int]
 
@@ -54,12 +151,15 @@ class Alignment:
         match: int = 2,
         mismatch: int = -1,
         gap: int = -1,
+        gapOpen: int = None,
+        gapExtend: int = None,
+        useProfiles: bool = False,
     ) -> None:
         """
         The __init__ function initializes the class with two sequences, a match score,
-        a mismatch score, and a gap penalty. It also initializes matScores to be an empty
-        list of lists (the same size as seqs) and matDir to be an empty list of lists (also
-        the same size as seqs). The for loops in __init__ fill these two variables with 0's.
+        a mismatch score, and a gap penalty. matScores and matDir are left empty until
+        an alignment function fills them.
+        gapOpen and gapExtend are the affine penalties used by GotohFill, they default to gap.
 
         :param self: Reference the object itself
         :param seq1: Store the first sequence
@@ -67,6 +167,9 @@ class Alignment:
         :param match=2: Set the match score
         :param mismatch=-1: Set the score for mismatches
         :param gap=-1: Set the gap penalty
+        :param gapOpen=None: Set the penalty of the first residue of a gap
+        :param gapExtend=None: Set the penalty of the next residues of a gap
+        :param useProfiles=False: Score groups with all their sequences instead of the best one
         :return: The list of lists matscores, which is the matrix that contains the scores for each pair of letters in seqs
         """
         if isinstance(seq1, str):
@@ -79,28 +182,36 @@ class Alignment:
         self.match = match
         self.mismatch = mismatch
         self.gap = gap
+        self.gapOpen = gap if gapOpen is None else gapOpen
+        self.gapExtend = gap if gapExtend is None else gapExtend
+        self.__affineLocal = False
+        # score groups column against column with every sequence (see __pairProfile)
+        self.useProfiles = useProfiles
+        # number of pairs of sequences behind each score, the gaps are multiplied by it
+        self.__weight = 1
 
-        self.__resetMatrix()  # Reset the matrices to all zeros
+        # matrices are allocated by the alignment functions
+        self.matScores = None
+        self.matDir = None
+        self.bandOffset = None
         self.aliSeqs = GroupSequences(self.seqs)
+        # runs of the current backtrack (see __insertStep)
+        self.__backtrace = []
 
     def __resetMatrix(self) -> None:
         """
         The __resetMatrix function is a helper function that resets the matScores and matDir
         matrices to all zeros. This is done so that when we call alignement function,
         we can reset these two matrices to their original state before we start our alignment.
+        matDir is a uint8 matrix where each cell holds the DirectionFlag bits of all its optimal directions.
 
         :param self: Represent the instance of the object itself
-        :return: A matrix of lists with the same dimensions as the input sequences, but instead of being filled with numbers, it is filled with empty lists
+        :return: Two matrices with the same dimensions as the input sequences filled with zeros
         """
-
-        self.matScores = [
-            [0 for _ in range(self.seqs[0].getLength() + 1)]
-            for _ in range(self.seqs[1].getLength() + 1)
-        ]
-        self.matDir = [
-            [[] for _ in range(self.seqs[0].getLength() + 1)]
-            for _ in range(self.seqs[1].getLength() + 1)
-        ]
+        shape = (self.seqs[1].getLength() + 1, self.seqs[0].getLength() + 1)
+        self.matScores = np.zeros(shape, dtype=np.int64)
+        self.matDir = np.zeros(shape, dtype=np.uint8)
+        self.bandOffset = None
 
     def __calculateScore(
         self, coord: Coord, previousScore: int, match: bool, useBlosum: bool
@@ -175,7 +286,335 @@ class Alignment:
         maxScore = max(score, key=lambda x: x[0])[0]
         return [i for i in score if i[0] == maxScore]
 
-    def NWSIterFill(self, useBlosum: bool = False) -> None:
+    def __representative(
+        self, sequence: Union[Sequence, GroupSequences]
+    ) -> Sequence:
+        """
+        The __representative function returns the sequence used to score a sequence, for a group
+        it is the representing sequence, the same one used by getIndex.
+
+        :param self: Access the attributes and methods of the class
+        :param sequence: The sequence or group of sequences
+        :return: The sequence whose residues are scored
+        """
+        if isinstance(sequence, GroupSequences):
+            return sequence.getSequence(sequence.indexOfBestSequence)
+        return sequence
+
+    def __profile(
+        self, useBlosum: bool, gap: int = None
+    ) -> Tuple[np.ndarray, Union[np.ndarray, PairProfile]]:
+        """
+        The __profile function returns the encoded residues of the vertical sequence and the
+        query profile of the horizontal one, so that profile[rows[i - 1]] is the score of every
+        diagonal move of the row i, following exactly the rules of __calculateScore.
+        The profile is cached on the sequence, unless the vertical sequence has residues outside
+        of the alphabet, then a complete one is built from the score table.
+        With useProfiles and a group on one side, the scores of every pair of columns are given
+        by __pairProfile instead, and rows are the indexes of its rows.
+
+        :param self: Access the attributes and methods of the class
+        :param useBlosum: Determine whether the blosum matrix should be used or not
+        :param gap: Score of a residue against a gap of a column of a group, None for gap
+        :return: The encoded rows and the profile of the columns
+        """
+        self.__weight = 1
+        if self.useProfiles and any(
+            isinstance(sequence, GroupSequences) for sequence in self.seqs
+        ):
+            return self.__pairProfile(useBlosum, self.gap if gap is None else gap)
+
+        rows = self.__representative(self.seqs[1]).getEncoded()
+        columns = self.__representative(self.seqs[0])
+        if useBlosum:
+            # like BLOSUM lookups, residues outside of the matrix are refused
+            for sequence in (rows, columns.getEncoded()):
+                if len(sequence) and sequence.max() >= PROFILE_SIZE:
+                    raise KeyError(decode(sequence[sequence >= PROFILE_SIZE][:1]))
+        if len(rows) and rows.max() >= PROFILE_SIZE:
+            table = scoreTable(self.match, self.mismatch, useBlosum)
+            return rows, table[:, columns.getEncoded()]
+        return rows, columns.getProfile(self.match, self.mismatch, useBlosum)
+
+    def __pairProfile(
+        self, useBlosum: bool, gap: int
+    ) -> Tuple[np.ndarray, PairProfile]:
+        """
+        The __pairProfile function scores every column of the vertical side against every column
+        of the horizontal one with all the sequences of both sides (sum of pairs): counts of the
+        rows x score table x counts of the columns, the same scores as Msa.getSumOfPairs
+        (see sumOfPairsTable). The scores are computed a row at a time (see PairProfile).
+        Every pair of sequences also pays the gaps, so the gap penalties are multiplied by the
+        number of pairs (__weight) and the scores of the alignment are sums over all the pairs.
+
+        :param self: Access the attributes and methods of the class
+        :param useBlosum: Determine whether the blosum matrix should be used or not
+        :param gap: Score of a residue against a gap inside a column
+        :return: The indexes of the rows and the score of every pair of columns
+        """
+        vertical = self.seqs[1].getColumnCounts()
+        horizontal = self.seqs[0].getColumnCounts()
+        used = np.flatnonzero(vertical.any(axis=1) | horizontal.any(axis=1))
+        if useBlosum and len(used) and used[-1] >= PROFILE_SIZE:
+            # like BLOSUM lookups, residues outside of the matrix are refused
+            raise KeyError(decode(used[used >= PROFILE_SIZE][:1]))
+        table = sumOfPairsTable(self.match, self.mismatch, useBlosum, gap)
+        self.__weight = self.seqs[0].numberOfSequences * self.seqs[1].numberOfSequences
+        profile = PairProfile(
+            vertical[used].T @ table[np.ix_(used, used)], horizontal[used]
+        )
+        return np.arange(profile.shape[0]), profile
+
+    def __fillMatrices(
+        self,
+        rows: np.ndarray,
+        profile: np.ndarray,
+        local: bool = False,
+        top: np.ndarray = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The __fillMatrices function fills the score and direction matrices row by row with numpy arrays.
+        The diagonal and up moves of a row only depends on the previous row, the left move
+        is resolved with a prefix maximum: H[j] = max(t[j], H[j - 1] + gap) is the same as
+        H[j] - gap * j = max(t[k] - gap * k for k <= j).
+        The direction matrix stores every optimal direction of a cell as DirectionFlag bits.
+
+        :param self: Access the attributes and methods of the class
+        :param rows: Encoded residues of the vertical sequence
+        :param profile: Profile of the horizontal sequence (see __profile)
+        :param local: Fill the matrices of SWIter, where a score can be reset to 0 (STOP)
+        :param top: Scores of the first row, None for the border of a whole matrix
+        :return: The score matrix and the direction matrix
+        """
+        gapScore = self.gap * self.__weight
+        gaps = gapScore * np.arange(profile.shape[1] + 1, dtype=np.int64)
+        # the borders of a local alignment never go below 0
+        border = max(0, gapScore) if local else gapScore
+        matScores = np.empty((len(rows) + 1, len(gaps)), dtype=np.int64)
+        matScores[0] = border * np.arange(len(gaps)) if top is None else top
+        matScores[:, 0] = matScores[0, 0] + border * np.arange(len(rows) + 1)
+        matDir = np.zeros(matScores.shape, dtype=np.uint8)
+        matDir[0, 1:] = DirectionFlag.LEFT if border > 0 or not local else DirectionFlag.STOP
+        matDir[:, 0] = DirectionFlag.UP if border > 0 or not local else DirectionFlag.STOP
+
+        diagFlag, upFlag, leftFlag, stopFlag = (
+            int(DirectionFlag.DIAG),
+            int(DirectionFlag.UP),
+            int(DirectionFlag.LEFT),
+            int(DirectionFlag.STOP),
+        )
+        for i in range(1, len(rows) + 1):
+            previous, current = matScores[i - 1], matScores[i]
+            diag = previous[:-1] + profile[rows[i - 1]]
+            up = previous[1:] + gapScore
+            current[1:] = np.maximum(diag, up)
+            if local:
+                np.maximum(current[1:], 0, out=current[1:])
+            current[:] = np.maximum.accumulate(current - gaps) + gaps
+            left = current[:-1] + gapScore
+            flags = (
+                (current[1:] == diag) * diagFlag
+                | (current[1:] == up) * upFlag
+                | (current[1:] == left) * leftFlag
+            )
+            if local:
+                flags |= (current[1:] == 0) * stopFlag
+            matDir[i, 1:] = flags
+        return matScores, matDir
+
+    def __lastRow(
+        self, rows: np.ndarray, profile: np.ndarray, top: np.ndarray = None
+    ) -> np.ndarray:
+        """
+        The __lastRow function computes the last row of the global score matrix
+        with the same recurrence as __fillMatrices, keeping only one row in memory.
+
+        :param self: Access the attributes and methods of the class
+        :param rows: Encoded residues of the vertical sequence
+        :param profile: Profile of the horizontal sequence (see __profile)
+        :param top: Scores of the first row, None for the border of a whole matrix
+        :return: The scores of the last row
+        """
+        gapScore = self.gap * self.__weight
+        gaps = gapScore * np.arange(profile.shape[1] + 1, dtype=np.int64)
+        current = gaps if top is None else top
+        for i in range(1, len(rows) + 1):
+            previous, current = current, np.empty_like(gaps)
+            current[0] = previous[0] + gapScore
+            current[1:] = np.maximum(
+                previous[:-1] + profile[rows[i - 1]], previous[1:] + gapScore
+            )
+            current = np.maximum.accumulate(current - gaps) + gaps
+        return current
+
+    def __lastDirection(self, flags: int) -> Union[Direction, None]:
+        """
+        The __lastDirection function returns the direction followed by the backtrack from a cell,
+        ie the last optimal direction found by __bestAction (see LAST_DIRECTION).
+
+        :param self: Access the attributes and methods of the class
+        :param flags: DirectionFlag bits of the cell
+        :return: The direction to follow, None to stop
+        """
+        return LAST_DIRECTION[flags]
+
+    def __insertStep(self, direction: Direction, i: int, j: int) -> Tuple[int, int]:
+        """
+        The __insertStep function records the column of one backtrack step in the backtrace,
+        a list of runs [direction, row, column, count] from the end of the alignment to its start.
+        Consecutive steps in the same direction extend the last run, the aligned sequences are
+        only built at the end of the backtrack by __buildAlignment.
+
+        :param self: Access the attributes and methods of the class
+        :param direction: Direction followed from the cell
+        :param i: Row of the cell
+        :param j: Column of the cell
+        :return: The coordinates of the previous cell
+        """
+        previous = i - (direction != Direction.LEFT), j - (direction != Direction.UP)
+        if self.__backtrace:
+            run = self.__backtrace[-1]
+            if run[0] == direction and run[1] == i and run[2] == j:
+                run[1], run[2] = previous
+                run[3] += 1
+                return previous
+        self.__backtrace.append([direction, *previous, 1])
+        return previous
+
+    def __buildAlignment(self) -> None:
+        """
+        The __buildAlignment function builds the aligned sequences of aliSeqs from the backtrace,
+        directly in the matrix of codes of the group: each run of the backtrace copies a block
+        of columns of all the sequences of a side at once, or leaves gaps.
+
+        :param self: Access the attributes and methods of the class
+        :return: None
+        """
+        runs = self.__backtrace[::-1]
+        length = sum(run[3] for run in runs)
+        blocks = []
+        for side, gapDirection in enumerate((Direction.UP, Direction.LEFT)):
+            sequence = self.seqs[side]
+            if isinstance(sequence, GroupSequences):
+                source = sequence.getMatrix()
+            else:
+                source = sequence.getEncoded()[None, :]
+            rows = np.full((len(source), length), GAP_CODE, dtype=np.uint8)
+            position = 0
+            for run in runs:
+                if run[0] != gapDirection:
+                    start = run[2 - side]
+                    rows[:, position : position + run[3]] = source[
+                        :, start : start + run[3]
+                    ]
+                position += run[3]
+            blocks.append(rows)
+        self.__backtrace = []
+        self.aliSeqs.setFromMatrix(np.concatenate(blocks))
+
+    def __fillBand(
+        self, rows: np.ndarray, profile: np.ndarray, low: int, high: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The __fillBand function fills the score and direction matrices like __fillMatrices,
+        but only for the cells (i, j) with low <= j - i <= high.
+        The matrices are band shaped: the cell (i, j) is stored at [i, j - i - low], so the
+        diagonal neighbour is at the same index of the previous row, the up one at the next index.
+        Cells outside of the sequences hold a very low score and no direction.
+
+        :param self: Access the attributes and methods of the class
+        :param rows: Encoded residues of the vertical sequence
+        :param profile: Profile of the horizontal sequence (see __profile)
+        :param low: Lowest diagonal of the band
+        :param high: Highest diagonal of the band
+        :return: The band shaped score matrix and direction matrix
+        """
+        gapScore = self.gap * self.__weight
+        length = profile.shape[1]
+        width = high - low + 1
+        minimum = np.iinfo(np.int64).min // 4
+        gaps = gapScore * np.arange(width, dtype=np.int64)
+        # one more column, so that the up neighbour of the last cell of a row exists
+        matScores = np.full((len(rows) + 1, width + 1), minimum, dtype=np.int64)
+        matDir = np.zeros((len(rows) + 1, width), dtype=np.uint8)
+
+        diagFlag, upFlag, leftFlag = (
+            int(DirectionFlag.DIAG),
+            int(DirectionFlag.UP),
+            int(DirectionFlag.LEFT),
+        )
+        start, stop = -low, min(width, length - low + 1)
+        matScores[0, start:stop] = gaps[: stop - start]
+        matDir[0, start:stop] = leftFlag
+        matDir[0, start] = upFlag
+        for i in range(1, len(rows) + 1):
+            # cells [start, stop) of the row are inside the matrix, j = i + low + index
+            start, stop = max(0, -i - low), min(width, length - i - low + 1)
+            if start >= stop:
+                continue
+            first = i + low + start
+            previous = matScores[i - 1]
+            scores = profile[rows[i - 1], max(first - 1, 0) : first - 1 + stop - start]
+            if first == 0:
+                # the first cell is on the border, its diagonal move is never used
+                scores = np.concatenate(([0], scores))
+            diag = previous[start:stop] + scores
+            up = previous[start + 1 : stop + 1] + gapScore
+            best = np.maximum(diag, up)
+            if first == 0:
+                best[0] = gapScore * i
+            steps = gaps[: stop - start]
+            best = np.maximum.accumulate(best - steps) + steps
+            matScores[i, start:stop] = best
+            # the left neighbour of the first cell is outside of the band or the matrix
+            left = np.empty_like(best)
+            left[0] = minimum
+            np.add(best[:-1], gapScore, out=left[1:])
+            flags = (
+                (best == diag) * diagFlag
+                | (best == up) * upFlag
+                | (best == left) * leftFlag
+            )
+            if first == 0:
+                flags[0] = upFlag
+            matDir[i, start:stop] = flags
+        matScores = matScores[:, :width]
+        return matScores, matDir
+
+    def __flags(self, i: int, j: int) -> int:
+        """
+        The __flags function returns the DirectionFlag bits of the cell (i, j) of matDir,
+        whether matDir is a full matrix or a band shaped one (see __fillBand).
+
+        :param self: Access the attributes and methods of the class
+        :param i: Row of the cell
+        :param j: Column of the cell
+        :return: The flags of the cell
+        """
+        if self.bandOffset is None:
+            return self.matDir[i, j]
+        return self.matDir[i, j - i - self.bandOffset]
+
+    def __globalPath(self) -> List[Tuple[int, int, Direction]]:
+        """
+        The __globalPath function returns the cells followed by NWSBacktrack, from the end
+        of the matrix to its start, without building the alignment.
+
+        :param self: Access the attributes and methods of the class
+        :return: The list of cells with the direction followed from each of them
+        """
+        path = []
+        j, i = self.seqs[0].getLength(), self.seqs[1].getLength()
+        while i > 0 or j > 0:
+            direction = self.__lastDirection(self.__flags(i, j))
+            path.append((i, j, direction))
+            i -= direction != Direction.LEFT
+            j -= direction != Direction.UP
+        return path
+
+    def NWSIterFill(
+        self, useBlosum: bool = False, vectorized: bool = True, band: int = None
+    ) -> None:
         """
         The NWSIterFill function fills the matScores and matDir arrays with the
         alignment scores for each cell in the matrix. The function iterates through
@@ -184,29 +623,68 @@ class Alignment:
         cell based on its neighbors' values. The score is calculated using a linear gap penalty
         and either a blosum62 substitution matrix or an affine gap penalty. If useBlosum is True, then
         the blosum62 substitution matrix will be used to calculate alignment scores; otherwise it will use an affine gap penalty.
+        With vectorized, the matrices are numpy arrays filled a whole row at a time (see __fillMatrices),
+        otherwise cells are filled one by one with __bestAction.
+        With band, only the cells at most band away from the diagonals of both corners are
+        filled (see __fillBand) and matDir is band shaped, bandOffset being its lowest diagonal.
+        The band is doubled as long as the path of NWSBacktrack touches one of its edges.
+        The result is then the unbanded one for homologous sequences, but it is not certified:
+        a path leaving the band and coming back could score better, eg across a repeat shifted
+        by more than the band. Only the whole matrix (band=None) is always exact.
 
         :param self: Access the class variables, such as self
         :param useBlosum=False: Indicate whether the blosum matrix should be used or not
+        :param vectorized=True: Fill the matrices with the numpy engine
+        :param band=None: Fill only a band around the diagonal
         :return: The best score for the given coordinate
         """
-        self.aliSeqs.resetForAlignment()
-        self.__resetMatrix()
-        for i, j in itertools.product(
-            range(self.seqs[1].getLength() + 1), range(self.seqs[0].getLength() + 1)
-        ):
-            if j == 0 or i == 0:
-                self.matScores[i][j] = self.gap * max(i, j)
-                if j == 0:
-                    self.matDir[i][j].append(Direction.UP)
+        self.bandOffset = None
+        if band is not None:
+            rows, profile = self.__profile(useBlosum)
+            length = profile.shape[1]
+            while True:
+                low = max(-len(rows), min(0, length - len(rows)) - band)
+                high = min(length, max(0, length - len(rows)) + band)
+                self.matScores, self.matDir = self.__fillBand(rows, profile, low, high)
+                self.bandOffset = low
+                if low == -len(rows) and high == length:
+                    break
+                # the path only depends on the band while it stays away from its edges
+                if not any(j - i in (low, high) for i, j, _ in self.__globalPath()):
+                    break
+                band = 2 * band or 1
+        elif vectorized:
+            self.matScores, self.matDir = self.__fillMatrices(
+                *self.__profile(useBlosum)
+            )
+        else:
+            # cells are filled one by one in python lists, numpy scalars being slow,
+            # then turned into the matrices of the other engines
+            self.__resetMatrix()
+            self.matScores = self.matScores.tolist()
+            flags = self.matDir.tolist()
+            for i, j in itertools.product(
+                range(self.seqs[1].getLength() + 1),
+                range(self.seqs[0].getLength() + 1),
+            ):
+                if j == 0 or i == 0:
+                    self.matScores[i][j] = self.gap * max(i, j)
+                    direction = Direction.UP if j == 0 else Direction.LEFT
+                    flags[i][j] = DIRECTION_BITS[direction]
                 else:
-                    self.matDir[i][j].append(Direction.LEFT)
-            else:
-                for score, direction in self.__bestAction(Coord(i, j), useBlosum):
-                    self.matScores[i][j] = score
-                    self.matDir[i][j].append(direction)
+                    cell = 0
+                    for score, direction in self.__bestAction(Coord(i, j), useBlosum):
+                        self.matScores[i][j] = score
+                        cell |= DIRECTION_BITS[direction]
+                    flags[i][j] = cell
+            self.matScores = np.array(self.matScores, dtype=np.int64)
+            self.matDir = np.array(flags, dtype=np.uint8)
 
+        end = self.seqs[0].getLength()
+        if self.bandOffset is not None:
+            end -= self.seqs[1].getLength() + self.bandOffset
         self.bestScore = (
-            self.matScores[-1][-1],
+            int(self.matScores[-1, end]),
             Coord(self.seqs[0].getLength(), self.seqs[1].getLength()),
         )
 
@@ -226,28 +704,242 @@ class Alignment:
         # we start from the end of the matrix
         j, i = self.seqs[0].getLength(), self.seqs[1].getLength()
         while i > 0 or j > 0:
-            match self.matDir[i][j][-1]:
-                case Direction.UP:
-                    self.aliSeqs.insertFromBacktrace(
-                        ["-"] * self.seqs[0].numberOfSequences
-                        + self.getIndex(self.seqs[1], i - 1)
-                    )
-                    i -= 1
-                case Direction.LEFT:
-                    self.aliSeqs.insertFromBacktrace(
-                        self.getIndex(self.seqs[0], j - 1)
-                        + ["-"] * self.seqs[1].numberOfSequences
-                    )
-                    j -= 1
-                case Direction.DIAG:
-                    self.aliSeqs.insertFromBacktrace(
-                        self.getIndex(self.seqs[0], j - 1)
-                        + self.getIndex(self.seqs[1], i - 1)
-                    )
-                    i -= 1
-                    j -= 1
-
-        self.aliSeqs.setAsAligned()
+            i, j = self.__insertStep(self.__lastDirection(self.__flags(i, j)), i, j)
+
+        self.__buildAlignment()
+
+    def __hirschberg(
+        self, rows: np.ndarray, profile: np.ndarray, top: np.ndarray
+    ) -> Tuple[List[Direction], int]:
+        """
+        The __hirschberg function follows the path of NWSBacktrack in linear space, from the end
+        of the matrix up to its first row, whose scores are top.
+        The vertical sequence is split in two halves. The forward scores of the middle row and
+        the backward scores of the bottom half give the first column where an optimal path
+        crosses the middle: the path of the backtrack only visits optimal cells, all on the
+        right of that column, and the directions of these cells do not depend on the cells on
+        its left. So the bottom half is solved first with the middle row as its first row and
+        only the columns from that one, which gives the column where the backtrack reaches the
+        middle row, then the top half is solved up to this column.
+        Small problems are filled with __fillMatrices and backtracked like NWSBacktrack, so ties
+        are broken the same way and the path is exactly the one of NWSBacktrack.
+
+        :param self: Access the attributes and methods of the class
+        :param rows: Encoded residues of the vertical sequence
+        :param profile: Profile of the horizontal sequence (see __profile)
+        :param top: Scores of the first row
+        :return: The directions of the path from the first row to the end of the matrix,
+        and the column where the path reaches the first row
+        """
+        length = profile.shape[1]
+        if len(rows) < 2 or (len(rows) + 1) * (length + 1) <= HIRSCHBERG_BLOCK:
+            matDir = self.__fillMatrices(rows, profile, top=top)[1]
+            path = []
+            i, j = len(rows), length
+            while i > 0:
+                direction = self.__lastDirection(matDir[i, j])
+                path.append(direction)
+                i -= direction != Direction.LEFT
+                j -= direction != Direction.UP
+            return path[::-1], j
+
+        middle = len(rows) // 2
+        forward = self.__lastRow(rows[:middle], profile, top)
+        backward = self.__lastRow(rows[middle:][::-1], profile[:, ::-1])[::-1]
+        first = int(np.argmax(forward + backward))
+        bottom, column = self.__hirschberg(
+            rows[middle:], profile[:, first:], forward[first:]
+        )
+        column += first
+        upper, column = self.__hirschberg(
+            rows[:middle], profile[:, :column], top[: column + 1]
+        )
+        return upper + bottom, column
+
+    def NWSHirschberg(self, useBlosum: bool = False) -> None:
+        """
+        The NWSHirschberg function computes an optimal global alignment like NWSIterFill
+        followed by NWSBacktrack, but in linear space with the Hirschberg divide and conquer,
+        matScores and matDir are never built so sequences of any length can be aligned.
+        Ties are broken like NWSBacktrack, so the alignment is the same (see __hirschberg).
+
+        :param self: Access the class attributes
+        :param useBlosum=False: Indicate whether the blosum matrix should be used or not
+        :return: None
+        """
+        rows, profile = self.__profile(useBlosum)
+        gaps = self.gap * self.__weight * np.arange(profile.shape[1] + 1, dtype=np.int64)
+        path, column = self.__hirschberg(rows, profile, gaps)
+        # the first row is only made of left moves
+        path = [Direction.LEFT] * column + path
+
+        score, i, j = 0, len(rows), profile.shape[1]
+        for direction in reversed(path):
+            if direction == Direction.DIAG:
+                score += profile[rows[i - 1], j - 1]
+            else:
+                score += self.gap * self.__weight
+            i, j = self.__insertStep(direction, i, j)
+        self.__buildAlignment()
+
+        self.bestScore = (
+            int(score),
+            Coord(self.seqs[0].getLength(), self.seqs[1].getLength()),
+        )
+
+    def __identityFill(self, useBlosum: bool, local: bool) -> float:
+        """
+        The __identityFill function computes the identity of the alignment that the backtrack would
+        return, without building matScores, matDir nor the aligned sequences.
+        The backtrack from a cell follows its last optimal direction (see __lastDirection) and
+        then the path of the previous cell, so the number of matches, the length and the number of
+        residues consumed by that path can be carried row by row next to the scores.
+        Left moves chain inside a row, they are resolved with a cumulative sum from the last
+        cell of the row which is not a left move.
+        In local mode the path is the one of SWBacktrack(full=True): the residues outside the
+        local alignment are added as gap columns.
+
+        :param self: Access the attributes and methods of the class
+        :param useBlosum: Determine whether the blosum matrix should be used or not
+        :param local: Compute the Smith-Waterman identity instead of the Needleman-Wunsch one
+        :return: The number of matches divided by the length of the alignment
+        """
+        # scores come from __profile, matches are counted on the representative sequences
+        scoreRows, profile = self.__profile(useBlosum)
+        gapScore = self.gap * self.__weight
+        rows = self.__representative(self.seqs[1]).getEncoded()
+        columns = self.__representative(self.seqs[0]).getEncoded()
+        gap = GAP_CODE
+        border = max(0, gapScore) if local else gapScore
+        gaps = gapScore * np.arange(len(columns) + 1, dtype=np.int64)
+        indexes = np.arange(len(columns) + 1)
+
+        # side arrays: matches, length and non gap residues consumed by the path of each cell
+        # a left move consumes a residue of the horizontal sequence
+        leftStep = np.zeros((3, len(columns) + 1), dtype=np.int64)
+        leftStep[0, 1:] = columns == gap
+        leftStep[1, 1:] = 1
+        leftStep[2, 1:] = columns != gap
+        borderStops = local and gapScore <= 0
+
+        scores = border * indexes
+        side = np.zeros_like(leftStep) if borderStops else np.cumsum(leftStep, axis=1)
+        best = None
+        for i in range(1, len(rows) + 1):
+            residue = rows[i - 1]
+            diag = scores[:-1] + profile[scoreRows[i - 1]]
+            up = scores[1:] + gapScore
+            current = np.empty_like(scores)
+            current[0] = border * i
+            current[1:] = np.maximum(diag, up)
+            if local:
+                current[1:] = np.maximum(current[1:], 0)
+            current = np.maximum.accumulate(current - gaps) + gaps
+
+            # direction of each cell, with the priority of __lastDirection
+            stop = np.zeros(len(columns) + 1, dtype=bool)
+            if local:
+                stop[1:] = current[1:] == 0
+            stop[0] = borderStops
+            left = np.zeros_like(stop)
+            left[1:] = (current[1:] == current[:-1] + gapScore) & ~stop[1:]
+            isUp = np.ones_like(stop)
+            isUp[1:] = current[1:] == up
+
+            upStep = np.array([residue == gap, 1, residue != gap], dtype=np.int64)
+            diagStep = np.stack(
+                (
+                    columns == residue,
+                    np.ones(len(columns), dtype=bool),
+                    (columns != gap).astype(np.int64) + (residue != gap),
+                )
+            )
+            values = np.empty_like(side)
+            values[:, 0] = side[:, 0] + upStep
+            values[:, 1:] = np.where(
+                isUp[1:], side[:, 1:] + upStep[:, None], side[:, :-1] + diagStep
+            )
+            values[:, stop] = 0
+            leftSum = np.cumsum(np.where(left, leftStep, 0), axis=1)
+            anchors = np.maximum.accumulate(np.where(left, 0, indexes))
+            side = values[:, anchors] - leftSum[:, anchors] + leftSum
+            scores = current
+
+            if local and len(columns):
+                j = int(np.argmax(scores[1:])) + 1
+                if best is None or scores[j] > best[0]:
+                    best = (int(scores[j]), Coord(i, j), side[:, j].copy())
+
+        if not local:
+            self.bestScore = (
+                int(scores[-1]),
+                Coord(self.seqs[0].getLength(), self.seqs[1].getLength()),
+            )
+            return int(side[0, -1]) / int(side[1, -1])
+
+        self.bestScore = best[:2]
+        matches, length, consumed = map(int, best[2])
+        # residues outside the local alignment are gap columns, gaps themselves are skipped
+        outside = int(np.sum(columns != gap) + np.sum(rows != gap)) - consumed
+        return matches / (length + outside)
+
+    def getIdentity(self) -> float:
+        """
+        The getIdentity function returns the identity of the aligned sequences of aliSeqs,
+        ie the number of matches divided by the length of the alignment, counted on the
+        representative sequences of both sides (see __representative).
+
+        :param self: Access the class attributes
+        :return: The identity of the alignment
+        """
+        matrix = self.aliSeqs.getMatrix()
+        indexes = []
+        for offset, sequence in zip((0, self.seqs[0].numberOfSequences), self.seqs):
+            best = getattr(sequence, "indexOfBestSequence", 0)
+            indexes.append(offset + best % sequence.numberOfSequences)
+        first, second = matrix[indexes]
+        return int(np.count_nonzero(first == second)) / len(first)
+
+    def NWSIdentity(
+        self, useBlosum: bool = False, band: int = None, linearSpace: bool = False
+    ) -> float:
+        """
+        The NWSIdentity function returns the identity of the alignment given by NWSIterFill
+        and NWSBacktrack, ie the number of matches divided by the length of the alignment.
+        With band, the banded NWSIterFill is used.
+        With linearSpace, only the last row of the matrices is kept (see __identityFill),
+        which is slower but never builds the matrices.
+
+        :param self: Access the class attributes
+        :param useBlosum=False: Indicate whether the blosum matrix should be used or not
+        :param band=None: Fill only a band around the diagonal
+        :param linearSpace=False: Compute the identity without the matrices
+        :return: The identity of the alignment
+        """
+        if linearSpace and band is None:
+            return self.__identityFill(useBlosum, local=False)
+
+        self.NWSIterFill(useBlosum, band=band)
+        self.NWSBacktrack()
+        return self.getIdentity()
+
+    def SWIdentity(self, useBlosum: bool = False, linearSpace: bool = False) -> float:
+        """
+        The SWIdentity function returns the identity of the alignment given by SWIter
+        and SWBacktrack(full=True).
+        With linearSpace, only the last row of the matrices is kept (see __identityFill).
+
+        :param self: Access the class attributes
+        :param useBlosum=False: Indicate whether the blosum matrix should be used or not
+        :param linearSpace=False: Compute the identity without the matrices
+        :return: The identity of the alignment
+        """
+        if linearSpace:
+            return self.__identityFill(useBlosum, local=True)
+
+        self.SWIter(useBlosum)
+        self.SWBacktrack(full=True)
+        return self.getIdentity()
 
     def getIndex(self, sequence: Union[Sequence, GroupSequences], index) -> List[str]:
         """
@@ -269,34 +961,22 @@ class Alignment:
         The SWIter function is a generator that yields the best alignment of two sequences.
         It does so by iteratively applying the Smith-Waterman algorithm to align two sequences.
         The function takes one argument, useBlosum, which is a boolean value indicating whether or not to use BLOSUM62 as the substitution matrix.
+        The matrices are filled a whole row at a time (see __fillMatrices), the best score
+        is the first cell (row by row) reaching the maximum of matScores.
 
         :param self: Access the class's attributes and methods
         :param useBlosum=False: Indicate whether the blosum62 matrix should be used or not
         :return: The best score for the current cell
         """
-        self.aliSeqs.resetForAlignment()
-        self.__resetMatrix()
+        self.bandOffset = None
         self.bestScore = None  # we need to reset the best score
-        for i, j in itertools.product(
-            range(self.seqs[1].getLength() + 1),
-            range(self.seqs[0].getLength() + 1),
-        ):
-            if j == 0 or i == 0:
-                self.matScores[i][j] = max(0, self.gap) * max(
-                    i, j
-                )  # initialisation we use 0 to reset score
-                if j == 0:
-                    self.matDir[i][j].append(Direction.UP if self.gap > 0 else None)
-                else:
-                    self.matDir[i][j].append(Direction.LEFT if self.gap > 0 else None)
-            else:
-                for score, direction in self.__bestAction(
-                    Coord(i, j), useBlosum=useBlosum, use0=True
-                ):
-                    self.matScores[i][j] = score
-                    self.matDir[i][j].append(direction)
-                    if not self.bestScore or score > self.bestScore[0]:
-                        self.bestScore = (score, Coord(i, j))
+        self.matScores, self.matDir = self.__fillMatrices(
+            *self.__profile(useBlosum), local=True
+        )
+        cells = self.matScores[1:, 1:]
+        if cells.size:
+            i, j = np.unravel_index(int(np.argmax(cells)), cells.shape)
+            self.bestScore = (int(cells[i, j]), Coord(int(i) + 1, int(j) + 1))
 
     def SWBacktrack(self, full=False) -> None:
         """
@@ -318,33 +998,15 @@ class Alignment:
         i, j = self.bestScore[1].x, self.bestScore[1].y
 
         while i > 0 or j > 0:
-            match self.matDir[i][j][-1]:
-                case Direction.UP:
-                    self.aliSeqs.insertFromBacktrace(
-                        ["-"] * self.seqs[0].numberOfSequences
-                        + self.getIndex(self.seqs[1], i - 1)
-                    )
-                    i -= 1
-                case Direction.LEFT:
-                    self.aliSeqs.insertFromBacktrace(
-                        self.getIndex(self.seqs[0], j - 1)
-                        + ["-"] * self.seqs[1].numberOfSequences
-                    )
-                    j -= 1
-                case Direction.DIAG:
-                    self.aliSeqs.insertFromBacktrace(
-                        self.getIndex(self.seqs[0], j - 1)
-                        + self.getIndex(self.seqs[1], i - 1)
-                    )
-                    i -= 1
-                    j -= 1
-                case None:
-                    break
+            direction = self.__lastDirection(self.matDir[i, j])
+            if direction is None:
+                break
+            i, j = self.__insertStep(direction, i, j)
 
         if full:
             # now we have the best local alignment we go to start of the matrix
             self.__goToCoord(Coord(j, i), Coord(0, 0))
-        self.aliSeqs.setAsAligned()
+        self.__buildAlignment()
 
     def __goToCoord(self, coord: Coord, target: Coord) -> Coord:
         """
@@ -361,17 +1023,147 @@ class Alignment:
         i, j = coord.x, coord.y
         for k in range(i, target.y, -1):
             if any(el != "-" for el in self.getIndex(self.seqs[0], k - 1)):
-                self.aliSeqs.insertFromBacktrace(
-                    self.getIndex(self.seqs[0], k - 1)
-                    + ["-"] * self.seqs[1].numberOfSequences
-                )
+                self.__insertStep(Direction.LEFT, j, k)
         for k in range(j, target.x, -1):
             if any(el != "-" for el in self.getIndex(self.seqs[1], k - 1)):
-                self.aliSeqs.insertFromBacktrace(
-                    ["-"] * self.seqs[0].numberOfSequences
-                    + self.getIndex(self.seqs[1], k - 1)
-                )
+                self.__insertStep(Direction.UP, k, target.y)
         return target
 
+    def GotohFill(self, useBlosum: bool = False, local: bool = False) -> None:
+        """
+        The GotohFill function fills matScores and matDir with affine gap penalties: a gap of
+        length k costs gapOpen + (k - 1) * gapExtend, so gapOpen = gapExtend = gap is the same
+        as NWSIterFill (or SWIter when local).
+        Three matrices are used, E for the alignments ending with a left move, F for the ones
+        ending with an up move and H the best of all. F only depends on the previous row,
+        left moves are resolved with a prefix maximum like __fillMatrices:
+        E[j] = max(E[j - 1] + step, T[j - 1] + gapOpen) where T is the best of H without E and
+        step is max(gapExtend, gapOpen).
+        Only H is kept in matScores, matDir holds the directions of H and the EXTEND_UP
+        and EXTEND_LEFT bits telling whether F and E extend a gap or open it.
+
+        :param self: Access the class attributes
+        :param useBlosum=False: Indicate whether the blosum matrix should be used or not
+        :param local=False: Compute a local alignment (Smith-Waterman) instead of a global one
+        :return: None
+        """
+        self.bestScore = None
+        self.__affineLocal = local
+        self.bandOffset = None
+        rows, profile = self.__profile(useBlosum, self.gapExtend)
+        opening, extension = (
+            self.gapOpen * self.__weight,
+            self.gapExtend * self.__weight,
+        )
+        step = max(opening, extension)
+        minimum = np.iinfo(np.int64).min // 4
+        steps = step * np.arange(profile.shape[1] + 1, dtype=np.int64)
+
+        self.matScores = np.empty((len(rows) + 1, len(steps)), dtype=np.int64)
+        self.matDir = np.zeros(self.matScores.shape, dtype=np.uint8)
+        diagFlag, upFlag, leftFlag, stopFlag, extendUpFlag, extendLeftFlag = map(
+            int,
+            (
+                DirectionFlag.DIAG,
+                DirectionFlag.UP,
+                DirectionFlag.LEFT,
+                DirectionFlag.STOP,
+                DirectionFlag.EXTEND_UP,
+                DirectionFlag.EXTEND_LEFT,
+            ),
+        )
+
+        up = np.full(len(steps), minimum, dtype=np.int64)  # F
+        left = np.full(len(steps), minimum, dtype=np.int64)  # E
+        for i in range(len(rows) + 1):
+            best = np.full(len(steps), minimum, dtype=np.int64)  # T
+            if i == 0:
+                best[: len(steps) if local else 1] = 0
+            else:
+                previous = self.matScores[i - 1]
+                extended = up + extension
+                up = np.maximum(extended, previous + opening)
+                best[0] = 0 if local else up[0]
+                best[1:] = np.maximum(previous[:-1] + profile[rows[i - 1]], up[1:])
+                if local:
+                    best[1:] = np.maximum(best[1:], 0)
+
+            left[1:] = (
+                np.maximum.accumulate(best[:-1] + opening - steps[:-1]) + steps[:-1]
+            )
+            current = self.matScores[i]
+            current[:] = np.maximum(best, left)
+            current[0] = best[0]
+
+            flags = np.zeros(len(steps), dtype=np.int64)
+            flags[1:] = (current[1:] == left[1:]) * leftFlag
+            flags[2:] |= (left[2:] == left[1:-1] + extension) * extendLeftFlag
+            if i > 0:
+                diag = previous[:-1] + profile[rows[i - 1]]
+                flags[1:] |= (current[1:] == up[1:]) * upFlag
+                flags[1:] |= (current[1:] == diag) * diagFlag
+                flags |= (up == extended) * extendUpFlag
+                flags[0] |= upFlag
+            if local:
+                flags[current == 0] |= stopFlag
+                flags[0] = stopFlag
+                if i > 0 and len(steps) > 1:
+                    j = int(np.argmax(current[1:])) + 1
+                    if self.bestScore is None or current[j] > self.bestScore[0]:
+                        self.bestScore = (int(current[j]), Coord(i, j))
+            self.matDir[i] = flags
+
+        if local:
+            self.matDir[0] = stopFlag
+        else:
+            self.bestScore = (
+                int(self.matScores[-1, -1]),
+                Coord(self.seqs[0].getLength(), self.seqs[1].getLength()),
+            )
+
+    def GotohBacktrack(self, full: bool = False) -> None:
+        """
+        The GotohBacktrack function builds the alignment filled by GotohFill, like NWSBacktrack for
+        a global alignment and like SWBacktrack for a local one.
+        Inside a gap the backtrack stays in E or F while the EXTEND bit of the cell is set.
+
+        :param self: Access the class attributes
+        :param full=False: For a local alignment, add the residues outside of the best local alignment
+        :return: None
+        """
+        if not self.__affineLocal:
+            j, i = self.seqs[0].getLength(), self.seqs[1].getLength()
+        else:
+            if full:
+                self.__goToCoord(
+                    Coord(self.seqs[0].getLength(), self.seqs[1].getLength()),
+                    self.bestScore[1],
+                )
+            i, j = self.bestScore[1].x, self.bestScore[1].y
+
+        gapDirection = None  # direction of the gap we are in, None when in H
+        while i > 0 or j > 0:
+            flags = self.matDir[i, j]
+            if gapDirection is None:
+                direction = self.__lastDirection(flags)
+                if direction is None:
+                    break
+                if direction == Direction.DIAG:
+                    i, j = self.__insertStep(direction, i, j)
+                    continue
+                gapDirection = direction
+            extend = flags & (
+                DirectionFlag.EXTEND_LEFT
+                if gapDirection == Direction.LEFT
+                else DirectionFlag.EXTEND_UP
+            )
+            i, j = self.__insertStep(gapDirection, i, j)
+            if not extend:
+                gapDirection = None
+
+        if self.__affineLocal and full:
+            self.__goToCoord(Coord(j, i), Coord(0, 0))
+        self.__buildAlignment()
+
     def __repr__(self) -> str:
         return str(self.aliSeqs)
@@ -0,0 +1,490 @@
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+from .alignement import Alignment
+from .BLOSUM import GAP_CODE, PROFILE_SIZE, decode, scoreTable
+from .fasta import readFastaMul
+from .msa import Algorithm
+from .sequence import Sequence
+
+# number of targets aligned with a query at once
+CHUNK_SIZE = 256
+# units of work waiting for a worker, per worker
+PENDING_UNITS = 4
+
+# aligner and sequences copied in each worker of a batch (see BatchAligner.run)
+_worker = None
+
+
+def _initWorker(
+    aligner: "BatchAligner", queries: List[Sequence], targets: List[Sequence]
+) -> None:
+    """
+    The _initWorker function keeps the aligner and the sequences sent to a worker process,
+    so that the sequences are only sent once per worker.
+
+    :param aligner: The aligner running the batch
+    :param queries: The query sequences
+    :param targets: The target sequences
+    :return: None
+    """
+    global _worker
+    _worker = (aligner, queries, targets)
+
+
+def _alignUnit(unit: Tuple[int, int, int]) -> List["BatchResult"]:
+    """
+    The _alignUnit function aligns in a worker a query with a range of targets.
+
+    :param unit: Index of the query, first and last (excluded) index of the targets
+    :return: The result of each pair
+    """
+    aligner, queries, targets = _worker
+    query, start, stop = unit
+    return aligner.alignTargets(queries[query], targets[start:stop])
+
+
+@dataclass
+class BatchResult(object):
+    # identifiers of both sequences and score of their alignment
+    query: str
+    target: str
+    score: int
+    # with alignments: matches / length of the alignment, aligned region of both sequences
+    # (positions start at 0, ends are excluded) and its CIGAR (=, X, I and D operations)
+    identity: float = None
+    queryStart: int = None
+    queryEnd: int = None
+    targetStart: int = None
+    targetEnd: int = None
+    cigar: str = None
+
+    def toRow(self) -> str:
+        """
+        The toRow function formats the result as a line of the output of a batch, tab separated
+        like its header (see BatchAligner.getHeader).
+
+        :param self: Access the attributes of the class
+        :return: The line, with its line break
+        """
+        fields = [self.query, self.target, str(self.score)]
+        if self.cigar is not None:
+            fields += [f"{self.identity:.6g}"]
+            fields += map(
+                str, (self.queryStart, self.queryEnd, self.targetStart, self.targetEnd)
+            )
+            fields += [self.cigar or "*"]
+        return "\t".join(fields) + "\n"
+
+
+class BatchAligner:
+    def __init__(
+        self,
+        algorithm: Algorithm = Algorithm.NeedlemanWunsch,
+        match: int = 2,
+        mismatch: int = -1,
+        gap: int = -1,
+        blosum: bool = False,
+        gapOpen: int = None,
+        gapExtend: int = None,
+        alignments: bool = False,
+        workers: int = None,
+        chunkSize: int = CHUNK_SIZE,
+    ) -> None:
+        """
+        The __init__ function sets up the alignment of many pairs of sequences: a global
+        (NeedlemanWunsch) or local (SmithWaterman) alignment with the scores of Alignment.
+        Without alignments, only the score of each pair is computed, a query against chunkSize
+        targets at once (see alignTargets), otherwise every pair is aligned and its CIGAR kept.
+
+        :param self: Reference the object itself
+        :param algorithm: Global or local alignment
+        :param match: Score of a match
+        :param mismatch: Score of a mismatch
+        :param gap: Gap penalty
+        :param blosum: Determine whether the blosum matrix should be used or not
+        :param gapOpen: Penalty of the first residue of a gap, affine gaps when given
+        :param gapExtend: Penalty of the next residues of a gap, affine gaps when given
+        :param alignments: Keep the alignment of each pair and not only its score
+        :param workers: Number of processes (1 or None to stay in this process)
+        :param chunkSize: Number of targets aligned with a query by a worker at once
+        :return: None
+        """
+        if algorithm not in (Algorithm.NeedlemanWunsch, Algorithm.SmithWaterman):
+            raise ValueError("Algorithm not supported")
+        self.algorithm = algorithm
+        self.match = match
+        self.mismatch = mismatch
+        self.gap = gap
+        self.blosum = blosum
+        # affine gap penalties (GotohFill), used as soon as one of them is given
+        self.gapOpen = gapOpen
+        self.gapExtend = gapExtend
+        self.affine = gapOpen is not None or gapExtend is not None
+        self.alignments = alignments
+        self.workers = workers
+        self.chunkSize = chunkSize
+
+    def getHeader(self, queries: int, targets: int = None) -> str:
+        """
+        The getHeader function returns the first lines of the output of a batch: a comment with
+        the settings and the sizes of the inputs, then the names of the columns.
+        A batch only resumes an output starting with the same header.
+
+        :param self: Access the attributes of the class
+        :param queries: Number of queries
+        :param targets: Number of targets, None for all the pairs of queries
+        :return: The header, with its line breaks
+        """
+        settings = (
+            f"# algorithm={self.algorithm.name} match={self.match} "
+            f"mismatch={self.mismatch} gap={self.gap} blosum={self.blosum} "
+            f"gapOpen={self.gapOpen} gapExtend={self.gapExtend} "
+            f"queries={queries} targets={targets}\n"
+        )
+        columns = ["query", "target", "score"]
+        if self.alignments:
+            columns += ["identity", "queryStart", "queryEnd", "targetStart"]
+            columns += ["targetEnd", "cigar"]
+        return settings + "\t".join(columns) + "\n"
+
+    def alignPair(self, query: Sequence, target: Sequence) -> BatchResult:
+        """
+        The alignPair function aligns two sequences with Alignment, the local alignments are
+        only the best local alignment (SWBacktrack and GotohBacktrack without full).
+
+        :param self: Access the attributes and methods of the class
+        :param query: First sequence, the horizontal one
+        :param target: Second sequence, the vertical one
+        :return: The result, with the alignment
+        """
+        alignment = Alignment(
+            query,
+            target,
+            match=self.match,
+            mismatch=self.mismatch,
+            gap=self.gap,
+            gapOpen=self.gapOpen,
+            gapExtend=self.gapExtend,
+        )
+        local = self.algorithm == Algorithm.SmithWaterman
+        if local and (not query.getLength() or not target.getLength()):
+            # no cell to start from, the best local alignment is empty
+            return BatchResult(query.id, target.id, 0, 0.0, 0, 0, 0, 0, "")
+        if self.affine:
+            alignment.GotohFill(useBlosum=self.blosum, local=local)
+            alignment.GotohBacktrack()
+        elif local:
+            alignment.SWIter(useBlosum=self.blosum)
+            alignment.SWBacktrack()
+        else:
+            alignment.NWSIterFill(useBlosum=self.blosum)
+            alignment.NWSBacktrack()
+
+        score, end = alignment.bestScore
+        # the end of a local alignment is its best cell, row (x) then column (y)
+        queryEnd, targetEnd = (end.y, end.x) if local else end.split()
+        matrix = alignment.aliSeqs.getMatrix()
+        residues = matrix != GAP_CODE
+        queryStart = queryEnd - int(residues[0].sum())
+        targetStart = targetEnd - int(residues[1].sum())
+
+        operations = np.where(matrix[0] == matrix[1], ord("="), ord("X"))
+        operations[~residues[1]] = ord("I")
+        operations[~residues[0]] = ord("D")
+        starts = np.flatnonzero(np.diff(operations, prepend=-1))
+        lengths = np.diff(np.append(starts, len(operations)))
+        cigar = "".join(
+            f"{length}{chr(operations[start])}"
+            for start, length in zip(starts, lengths)
+        )
+        identity = np.sum(matrix[0] == matrix[1]) / max(matrix.shape[1], 1)
+        return BatchResult(
+            query.id,
+            target.id,
+            int(score),
+            float(identity),
+            queryStart,
+            queryEnd,
+            targetStart,
+            targetEnd,
+            cigar,
+        )
+
+    def alignTargets(
+        self, query: Sequence, targets: List[Sequence]
+    ) -> List[BatchResult]:
+        """
+        The alignTargets function aligns a query with each target, with alignPair when the
+        alignments are kept, otherwise only the scores are computed by __scoreTargets.
+
+        :param self: Access the attributes and methods of the class
+        :param query: The query
+        :param targets: The targets
+        :return: The result of each pair, in the order of the targets
+        """
+        if self.alignments:
+            return [self.alignPair(query, target) for target in targets]
+        scores = self.__scoreTargets(query, targets)
+        return [
+            BatchResult(query.id, target.id, int(score))
+            for target, score in zip(targets, scores)
+        ]
+
+    def __scoreTargets(self, query: Sequence, targets: List[Sequence]) -> np.ndarray:
+        """
+        The __scoreTargets function computes the scores of the alignments of a query with many
+        targets at once, without keeping the matrices nor the directions.
+        The targets are the columns of a single (number of targets, longest target + 1) matrix
+        filled row by row with the recurrence of GotohFill (linear gaps being gapOpen =
+        gapExtend = gap), so every numpy operation works on all the targets instead of one.
+        The columns after the end of a target are padding, never read back: in a row, the
+        scores only flow from a column to the next ones.
+        The query is the vertical sequence, the scores are the same as with Alignment(query,
+        target) since both the scores and the gaps are symmetrical.
+
+        :param self: Access the attributes of the class
+        :param query: The query
+        :param targets: The targets
+        :return: The score of each target
+        """
+        local = self.algorithm == Algorithm.SmithWaterman
+        lengths = np.array([target.getLength() for target in targets], dtype=np.int64)
+        width = int(lengths.max(initial=0))
+        codes = np.zeros((len(targets), width), dtype=np.uint8)
+        for row, target in zip(codes, targets):
+            row[: target.getLength()] = target.getEncoded()
+        rows = query.getEncoded()
+        if self.blosum:
+            # like BLOSUM lookups, residues outside of the matrix are refused
+            for sequence in [rows] + [target.getEncoded() for target in targets]:
+                if len(sequence) and sequence.max() >= PROFILE_SIZE:
+                    raise KeyError(decode(sequence[sequence >= PROFILE_SIZE][:1]))
+        table = scoreTable(self.match, self.mismatch, self.blosum)
+
+        opening = self.gap if self.gapOpen is None else self.gapOpen
+        extension = self.gap if self.gapExtend is None else self.gapExtend
+        step = max(opening, extension)
+        minimum = np.iinfo(np.int64).min // 4
+        steps = step * np.arange(width, dtype=np.int64)
+        shape = (len(targets), width + 1)
+
+        up = np.full(shape, minimum, dtype=np.int64)
+        best = np.full(shape, minimum, dtype=np.int64)
+        best[:, : shape[1] if local else 1] = 0
+        left = np.full(shape, minimum, dtype=np.int64)
+        left[:, 1:] = np.maximum.accumulate(best[:, :-1] + opening - steps, axis=1)
+        left[:, 1:] += steps
+        current = np.maximum(best, left)
+        current[:, 0] = best[:, 0]
+        # best score of each cell of a column so far, for the local alignments
+        highest = current.copy()
+
+        for residue in rows:
+            previous = current
+            up = np.maximum(up + extension, previous + opening)
+            best = np.empty(shape, dtype=np.int64)
+            best[:, 0] = 0 if local else up[:, 0]
+            diag = previous[:, :-1] + table[residue, codes]
+            np.maximum(diag, up[:, 1:], out=best[:, 1:])
+            if local:
+                np.maximum(best[:, 1:], 0, out=best[:, 1:])
+            left[:, 1:] = np.maximum.accumulate(best[:, :-1] + opening - steps, axis=1)
+            left[:, 1:] += steps
+            current = np.maximum(best, left)
+            current[:, 0] = best[:, 0]
+            if local:
+                np.maximum(highest, current, out=highest)
+
+        if local:
+            # the padding columns can not hold the best score
+            inside = np.arange(shape[1]) <= lengths[:, None]
+            return np.where(inside, highest, 0).max(axis=1, initial=0)
+        return current[np.arange(len(targets)), lengths]
+
+    def __units(
+        self, queries: int, targets: int, done: int
+    ) -> Iterator[Tuple[int, int, int]]:
+        """
+        The __units function splits the pairs left to align in units of a query and at most
+        chunkSize consecutive targets. Pairs are ordered by query then by target, with all the
+        pairs of queries (i, j), i < j, when there are no targets.
+
+        :param self: Access the attributes of the class
+        :param queries: Number of queries
+        :param targets: Number of targets, None for all the pairs of queries
+        :param done: Number of pairs already aligned, skipped
+        :return: The index of the query, first and last (excluded) index of the targets
+        """
+        for query in range(queries):
+            first = query + 1 if targets is None else 0
+            last = queries if targets is None else targets
+            if done >= last - first:
+                done -= last - first
+                continue
+            for start in range(first + done, last, self.chunkSize):
+                yield query, start, min(start + self.chunkSize, last)
+            done = 0
+
+    def __resume(self, output: str, header: str) -> int:
+        """
+        The __resume function opens the output of a batch to append to it: the rows already
+        written are the pairs already aligned, a row cut by the end of a killed run is removed.
+        A new output (or one holding a part of the header) is started with the header.
+
+        :param self: Access the attributes of the class
+        :param output: Path of the output
+        :param header: Header of the batch (see getHeader)
+        :return: Number of pairs already aligned
+        """
+        encoded = header.encode()
+        if os.path.exists(output):
+            with open(output, "rb+") as file:
+                start = file.read(len(encoded))
+                if start == encoded:
+                    lines, end, position = 0, file.tell(), file.tell()
+                    for chunk in iter(lambda: file.read(1 << 20), b""):
+                        lines += chunk.count(b"\n")
+                        if b"\n" in chunk:
+                            end = position + chunk.rindex(b"\n") + 1
+                        position += len(chunk)
+                    file.truncate(end)
+                    return lines
+                if not encoded.startswith(start):
+                    raise ValueError(f"{output} was written by another batch")
+        with open(output, "wb") as file:
+            file.write(encoded)
+        return 0
+
+    def run(
+        self,
+        queries: List[Sequence],
+        targets: List[Sequence] = None,
+        output: str = None,
+    ) -> Iterator[BatchResult]:
+        """
+        The run function aligns each query with each target, or each pair of queries when there
+        are no targets, and yields the results as soon as they are known, in the order of the
+        pairs (see __units).
+        With workers, units are aligned by a process pool, each worker receiving the sequences
+        once, and at most PENDING_UNITS units per worker are waiting so that the results stream.
+        With output, the results are also written as rows of a tab separated file, flushed unit
+        by unit: the file is the checkpoint of the batch, running the same batch again only
+        aligns the pairs it does not hold yet.
+
+        :param self: Access the attributes and methods of the class
+        :param queries: The queries
+        :param targets: The targets, None to align the queries all against all
+        :param output: Path of the output, None to only yield the results
+        :return: The results of the pairs not aligned yet
+        """
+        size = None if targets is None else len(targets)
+        header = self.getHeader(len(queries), size)
+        done = 0 if output is None else self.__resume(output, header)
+        units = self.__units(len(queries), size, done)
+        file = None if output is None else open(output, "a")
+        try:
+            for results in self.__runUnits(queries, targets, units):
+                if file is not None:
+                    file.writelines(result.toRow() for result in results)
+                    file.flush()
+                yield from results
+        finally:
+            if file is not None:
+                file.close()
+
+    def __runUnits(
+        self,
+        queries: List[Sequence],
+        targets: List[Sequence],
+        units: Iterator[Tuple[int, int, int]],
+    ) -> Iterator[List[BatchResult]]:
+        """
+        The __runUnits function aligns the units in order, in this process or in a process pool.
+
+        :param self: Access the attributes and methods of the class
+        :param queries: The queries
+        :param targets: The targets, None when the queries are aligned all against all
+        :param units: The units to align (see __units)
+        :return: The results of each unit
+        """
+        targets = queries if targets is None else targets
+        if self.workers is None or self.workers <= 1:
+            for query, start, stop in units:
+                yield self.alignTargets(queries[query], targets[start:stop])
+            return
+
+        with ProcessPoolExecutor(
+            self.workers, initializer=_initWorker, initargs=(self, queries, targets)
+        ) as executor:
+            pending = deque()
+            for unit in units:
+                pending.append(executor.submit(_alignUnit, unit))
+                if len(pending) >= self.workers * PENDING_UNITS:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+
+def main(arguments: List[str]) -> None:
+    """
+    The main function aligns the sequences of fasta files, usage:
+    python -m src.batch queries.fasta [targets.fasta] [-o output.tsv] [options]
+    Without targets, every pair of queries is aligned. Without output, the rows are printed.
+
+    :param arguments: The command line arguments
+    :return: None
+    """
+    parser = argparse.ArgumentParser(prog="python -m src.batch")
+    parser.add_argument("queries", help="fasta file of the queries")
+    parser.add_argument("targets", nargs="?", help="fasta file of the targets")
+    parser.add_argument("-o", "--output", help="output, resumed if it already exists")
+    parser.add_argument("--local", action="store_true", help="local alignments")
+    parser.add_argument("--alignments", action="store_true", help="write the CIGARs")
+    parser.add_argument("--match", type=int, default=2)
+    parser.add_argument("--mismatch", type=int, default=-1)
+    parser.add_argument("--gap", type=int, default=-1)
+    parser.add_argument("--gap-open", type=int)
+    parser.add_argument("--gap-extend", type=int)
+    parser.add_argument("--blosum", action="store_true", help="score with BLOSUM62")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    options = parser.parse_args(arguments)
+
+    aligner = BatchAligner(
+        Algorithm.SmithWaterman if options.local else Algorithm.NeedlemanWunsch,
+        match=options.match,
+        mismatch=options.mismatch,
+        gap=options.gap,
+        blosum=options.blosum,
+        gapOpen=options.gap_open,
+        gapExtend=options.gap_extend,
+        alignments=options.alignments,
+        workers=options.workers,
+        chunkSize=options.chunk_size,
+    )
+    queries = list(readFastaMul(options.queries))
+    targets = None if options.targets is None else list(readFastaMul(options.targets))
+    if options.output is None:
+        size = None if targets is None else len(targets)
+        sys.stdout.write(aligner.getHeader(len(queries), size))
+
+    start, count = time.perf_counter(), 0
+    for result in aligner.run(queries, targets, options.output):
+        if options.output is None:
+            sys.stdout.write(result.toRow())
+        count += 1
+    seconds = time.perf_counter() - start
+    print(f"{count} pairs aligned in {seconds:.1f} s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
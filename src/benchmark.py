@@ -0,0 +1,276 @@
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+from .alignement import Alignment
+from .msa import Algorithm, Msa
+from .sequence import Sequence
+
+# residues of the synthetic proteins
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+# lengths of the pairwise benchmarks and numbers of sequences of the msa benchmarks
+LENGTHS = (100, 300, 1000)
+COUNTS = (8, 16, 32)
+# length of the sequences of the msa benchmarks
+MSA_LENGTH = 150
+
+
+def randomFamily(
+    count: int,
+    length: int,
+    divergence: float = 0.3,
+    indelRate: float = 0.02,
+    seed: int = 0,
+) -> List[Sequence]:
+    """
+    The randomFamily function generates a family of proteins: a random ancestor of the given
+    length, and count members where each residue of the ancestor is substituted with the
+    probability divergence, deleted with the probability indelRate / 2 and followed by a random
+    residue with the probability indelRate / 2.
+    The same seed always gives the same family.
+
+    :param count: Number of sequences
+    :param length: Length of the ancestor
+    :param divergence: Probability of substitution of each residue
+    :param indelRate: Probability of an insertion or a deletion at each residue
+    :param seed: Seed of the random generator
+    :return: The sequences of the family
+    """
+    generator = np.random.default_rng(seed)
+    letters = np.frombuffer(AMINO_ACIDS.encode(), dtype=np.uint8)
+    ancestor = generator.choice(letters, length)
+    family = []
+    for index in range(count):
+        residues = ancestor.copy()
+        substituted = generator.random(length) < divergence
+        residues[substituted] = generator.choice(letters, int(substituted.sum()))
+        events = generator.random(length)
+        deleted = events < indelRate / 2
+        inserted = (events >= indelRate / 2) & (events < indelRate)
+        # every residue is followed by its insertion, if any, then deleted residues are removed
+        pieces = np.stack([residues, generator.choice(letters, length)], axis=1)
+        kept = np.stack([~deleted, inserted], axis=1)
+        family.append(Sequence(f"seq{index}", pieces[kept].tobytes().decode()))
+    return family
+
+
+def measure(
+    function: Callable[..., Any],
+    repeats: int = 3,
+    prepare: Callable[[], Any] = None,
+) -> Tuple[float, int]:
+    """
+    The measure function times a function: the best time of several runs, then the peak of the
+    memory allocated by one more run (tracemalloc, which slows it down, so it is not timed).
+
+    :param function: The function to measure, given what prepare returns if there is prepare
+    :param repeats: Number of timed runs
+    :param prepare: Function called before each run and not timed, None for no preparation
+    :return: The best time in seconds and the peak memory in bytes
+    """
+    best = float("inf")
+    for _ in range(repeats):
+        arguments = () if prepare is None else (prepare(),)
+        start = time.perf_counter()
+        function(*arguments)
+        best = min(best, time.perf_counter() - start)
+
+    arguments = () if prepare is None else (prepare(),)
+    tracemalloc.start()
+    try:
+        function(*arguments)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def benchmarkPairwise(
+    length: int, seed: int = 0, repeats: int = 3, useBlosum: bool = True
+) -> List[Dict]:
+    """
+    The benchmarkPairwise function measures the fills and backtracks of Alignment and the
+    pairwise score of Msa on two members of a synthetic family.
+    A backtrack is measured on its own: its matrices are filled before each run.
+
+    :param length: Length of the ancestor of the family
+    :param seed: Seed of the family
+    :param repeats: Number of timed runs
+    :param useBlosum: Determine whether the blosum matrix should be used or not
+    :return: A result per benchmark (see makeResult)
+    """
+    first, second = randomFamily(2, length, seed=seed)
+    cells = (first.getLength() + 1) * (second.getLength() + 1)
+    msa = Msa([first, second], Algorithm.NeedlemanWunsch, blosum=useBlosum)
+
+    def filled(fill: str) -> Alignment:
+        alignment = Alignment(first, second)
+        getattr(alignment, fill)(useBlosum=useBlosum)
+        return alignment
+
+    results = []
+    for fill, backtrack in (("NWSIterFill", "NWSBacktrack"), ("SWIter", "SWBacktrack")):
+        seconds, peak = measure(lambda: filled(fill), repeats)
+        results.append(makeResult(fill, length, 2, seconds, peak, cells))
+        seconds, peak = measure(
+            lambda alignment: getattr(alignment, backtrack)(),
+            repeats,
+            prepare=lambda: filled(fill),
+        )
+        results.append(makeResult(backtrack, length, 2, seconds, peak, cells))
+    seconds, peak = measure(lambda: msa.getPairwiseScore(first, second), repeats)
+    results.append(makeResult("getPairwiseScore", length, 2, seconds, peak, cells))
+    return results
+
+
+def benchmarkMsa(
+    count: int, length: int = MSA_LENGTH, seed: int = 0, repeats: int = 1, **settings
+) -> Dict:
+    """
+    The benchmarkMsa function measures Msa.align on a synthetic family.
+    Its cells are the cells of the pairwise stage, the merges are not counted.
+
+    :param count: Number of sequences of the family
+    :param length: Length of the ancestor of the family
+    :param seed: Seed of the family
+    :param repeats: Number of timed runs
+    :param settings: Parameters of Msa, by default Needleman-Wunsch
+    :return: The result (see makeResult)
+    """
+    family = randomFamily(count, length, seed=seed)
+    settings.setdefault("algorithm", Algorithm.NeedlemanWunsch)
+    lengths = np.array([sequence.getLength() + 1 for sequence in family])
+    cells = int((lengths.sum() ** 2 - (lengths**2).sum()) // 2)
+    seconds, peak = measure(lambda: Msa(family, **settings).align(), repeats)
+    return makeResult("Msa.align", length, count, seconds, peak, cells)
+
+
+def makeResult(
+    name: str, length: int, count: int, seconds: float, peak: int, cells: int
+) -> Dict:
+    """
+    The makeResult function builds the record of a benchmark.
+
+    :param name: Name of the benchmark
+    :param length: Length of the ancestor of the family
+    :param count: Number of sequences
+    :param seconds: Best time
+    :param peak: Peak memory in bytes
+    :param cells: Number of cells of the alignment matrices
+    :return: The record, a dict ready for JSON
+    """
+    return {
+        "name": name,
+        "length": length,
+        "count": count,
+        "seconds": seconds,
+        "cells": cells,
+        "cellsPerSecond": cells / seconds if seconds else float("inf"),
+        "peakBytes": peak,
+    }
+
+
+def runBenchmarks(
+    lengths: Tuple[int, ...] = LENGTHS,
+    counts: Tuple[int, ...] = COUNTS,
+    seed: int = 0,
+    repeats: int = 3,
+) -> Dict:
+    """
+    The runBenchmarks function runs the pairwise benchmarks for each length and the msa
+    benchmarks for each number of sequences.
+
+    :param lengths: Lengths of the pairwise benchmarks
+    :param counts: Numbers of sequences of the msa benchmarks
+    :param seed: Seed of the families
+    :param repeats: Number of timed runs of the pairwise benchmarks
+    :return: The record of the run: the environment and the list of results
+    """
+    results = []
+    for length in lengths:
+        results += benchmarkPairwise(length, seed=seed, repeats=repeats)
+    for count in counts:
+        results.append(benchmarkMsa(count, seed=seed))
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "seed": seed,
+        "results": results,
+    }
+
+
+def compareRecords(before: Dict, after: Dict) -> List[Dict]:
+    """
+    The compareRecords function compares two records of runBenchmarks, eg of two versions:
+    the speedup of each benchmark found in both.
+
+    :param before: Record of the reference version
+    :param after: Record of the new version
+    :return: Name, length, count, both times and the speedup of each benchmark
+    """
+    keys = lambda result: (result["name"], result["length"], result["count"])
+    reference = {keys(result): result for result in before["results"]}
+    comparison = []
+    for result in after["results"]:
+        if keys(result) not in reference:
+            continue
+        old = reference[keys(result)]["seconds"]
+        comparison.append(
+            {
+                "name": result["name"],
+                "length": result["length"],
+                "count": result["count"],
+                "before": old,
+                "after": result["seconds"],
+                "speedup": old / result["seconds"] if result["seconds"] else float("inf"),
+            }
+        )
+    return comparison
+
+
+def describe(result: Dict) -> str:
+    """
+    The describe function names the benchmark of a result or of a comparison.
+
+    :param result: The result
+    :return: Its name, length and number of sequences, aligned in columns
+    """
+    return (
+        f"{result['name']:<18} length {result['length']:>5} count {result['count']:>3}"
+    )
+
+
+def main(arguments: List[str]) -> None:
+    """
+    The main function runs the benchmarks and writes their record, usage:
+    python -m src.benchmark [record.json] [reference.json]
+    With a reference record, the speedups against it are printed as well.
+
+    :param arguments: Path of the record to write and of the reference record, both optional
+    :return: None
+    """
+    record = runBenchmarks()
+    for result in record["results"]:
+        print(
+            f"{describe(result)}  {result['seconds'] * 1000:10.2f} ms"
+            f"  {result['cellsPerSecond']:12.3g} cells/s"
+            f"  {result['peakBytes'] / 2**20:8.2f} MiB"
+        )
+    if arguments:
+        with open(arguments[0], "w") as file:
+            json.dump(record, file, indent=2)
+    if len(arguments) > 1:
+        with open(arguments[1]) as file:
+            reference = json.load(file)
+        for line in compareRecords(reference, record):
+            print(f"{describe(line)}  x{line['speedup']:.2f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
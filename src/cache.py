@@ -0,0 +1,144 @@
+import hashlib
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Tuple
+
+# number of keys of a single sqlite query, under the limit of bound parameters
+QUERY_SIZE = 900
+
+
+class ScoreCache:
+    def __init__(self, path: str, maxEntries: int = 1_000_000) -> None:
+        """
+        The __init__ function opens (or creates) a cache of pairwise scores stored in a sqlite file.
+        When the cache holds more than maxEntries scores, the least recently used ones are removed.
+
+        :param self: Reference the object itself
+        :param path: Path of the sqlite file
+        :param maxEntries: Maximum number of scores kept in the file
+        :return: None
+        """
+        self.path = path
+        self.maxEntries = maxEntries
+        # number of scores found and not found in the cache
+        self.hits = 0
+        self.misses = 0
+        self.__connection = None
+
+    def __connect(self) -> sqlite3.Connection:
+        """
+        The __connect function opens the sqlite file on first use.
+
+        :param self: Access the attributes and methods of the class
+        :return: The connection to the file
+        """
+        if self.__connection is None:
+            self.__connection = sqlite3.connect(self.path)
+            self.__connection.execute(
+                "CREATE TABLE IF NOT EXISTS scores "
+                "(key BLOB PRIMARY KEY, score REAL NOT NULL, used REAL NOT NULL)"
+            )
+            self.__connection.execute(
+                "CREATE INDEX IF NOT EXISTS scores_used ON scores (used)"
+            )
+        return self.__connection
+
+    @staticmethod
+    def makeKey(settings: str, first: str, second: str) -> bytes:
+        """
+        The makeKey function builds the key of the score of a pair of sequences:
+        a hash of the scoring settings and of both sequences, in order.
+
+        :param settings: Description of everything the score depends on
+        :param first: Residues of the first sequence
+        :param second: Residues of the second sequence
+        :return: The key of the pair
+        """
+        digest = hashlib.sha256()
+        for text in (settings, first, second):
+            part = text.encode()
+            # lengths keep the parts apart, so that different pairs never give the same text
+            digest.update(len(part).to_bytes(8, "little") + part)
+        return digest.digest()
+
+    def lookup(self, keys: List[bytes]) -> Dict[bytes, float]:
+        """
+        The lookup function returns the cached scores of the keys that are in the cache,
+        and marks them as recently used.
+
+        :param self: Access the attributes and methods of the class
+        :param keys: The keys to look for
+        :return: The score of each key found
+        """
+        connection = self.__connect()
+        found = {}
+        for start in range(0, len(keys), QUERY_SIZE):
+            chunk = keys[start : start + QUERY_SIZE]
+            marks = ",".join("?" * len(chunk))
+            found.update(
+                connection.execute(
+                    f"SELECT key, score FROM scores WHERE key IN ({marks})", chunk
+                )
+            )
+        now = time.time()
+        foundKeys = list(found)
+        with connection:
+            for start in range(0, len(foundKeys), QUERY_SIZE):
+                chunk = foundKeys[start : start + QUERY_SIZE]
+                marks = ",".join("?" * len(chunk))
+                connection.execute(
+                    f"UPDATE scores SET used = ? WHERE key IN ({marks})", [now, *chunk]
+                )
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def store(self, items: Iterable[Tuple[bytes, float]]) -> None:
+        """
+        The store function adds scores to the cache, then removes the least recently used
+        scores above maxEntries.
+
+        :param self: Access the attributes and methods of the class
+        :param items: Pairs of key and score
+        :return: None
+        """
+        connection = self.__connect()
+        now = time.time()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO scores VALUES (?, ?, ?)",
+                ((key, score, now) for key, score in items),
+            )
+            (count,) = connection.execute("SELECT COUNT(*) FROM scores").fetchone()
+            if count > self.maxEntries:
+                connection.execute(
+                    "DELETE FROM scores WHERE key IN "
+                    "(SELECT key FROM scores ORDER BY used LIMIT ?)",
+                    (count - self.maxEntries,),
+                )
+
+    def getSize(self) -> int:
+        """
+        The getSize function returns the number of scores in the cache.
+
+        :param self: Access the attributes and methods of the class
+        :return: The number of scores
+        """
+        return self.__connect().execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+
+    def close(self) -> None:
+        """
+        The close function closes the sqlite file, it is opened again on next use.
+
+        :param self: Access the attributes and methods of the class
+        :return: None
+        """
+        if self.__connection is not None:
+            self.__connection.close()
+            self.__connection = None
+
+    def __getstate__(self) -> dict:
+        # the connection is not sent to other processes, they open the file again if needed
+        state = self.__dict__.copy()
+        state["_ScoreCache__connection"] = None
+        return state
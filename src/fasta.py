@@ -1,36 +1,454 @@
-import re
-from typing import Tuple
+import gzip
+import io
+import mmap
+import os
+import queue
+import struct
+import threading
+import zlib
+from bisect import bisect_right
+from typing import BinaryIO, Dict, Iterator, List, Tuple, Union
 
 from .sequence import Sequence
 
+# extension of the index of a fasta file (see buildFastaIndex)
+INDEX_EXTENSION = ".idx"
+# first bytes of a gzip file, bgzip files are gzip files made of independent blocks
+GZIP_MAGIC = b"\x1f\x8b"
+# size of the chunks decompressed by BackgroundReader and number of chunks waiting
+CHUNK_SIZE = 1 << 20
+CHUNK_QUEUE = 4
+
+
+class BackgroundReader(io.RawIOBase):
+    def __init__(self, stream: BinaryIO) -> None:
+        """
+        The __init__ function starts a thread reading a stream in chunks of CHUNK_SIZE bytes,
+        so that reading (and decompressing, zlib releases the GIL) overlaps with the parsing.
+        At most CHUNK_QUEUE chunks wait to be read.
+
+        :param self: Reference the object itself
+        :param stream: The binary stream to read, closed with the reader
+        :return: None
+        """
+        super().__init__()
+        self.__stream = stream
+        self.__chunks = queue.Queue(CHUNK_QUEUE)
+        self.__chunk = memoryview(b"")
+        self.__finished = False
+        self.__stopped = threading.Event()
+        self.__thread = threading.Thread(target=self.__fill, daemon=True)
+        self.__thread.start()
+
+    def __fill(self) -> None:
+        """
+        The __fill function reads the stream in the thread, until its end or until the reader
+        is closed. An exception is given to the reading side.
+
+        :param self: Access the attributes and methods of the class
+        :return: None
+        """
+        try:
+            chunk = True
+            while chunk and not self.__stopped.is_set():
+                chunk = self.__stream.read(CHUNK_SIZE)
+                self.__put(chunk)
+        except Exception as error:
+            self.__put(error)
+
+    def __put(self, item: Union[bytes, Exception]) -> None:
+        """
+        The __put function waits for room in the queue, unless the reader is closed.
+
+        :param self: Access the attributes and methods of the class
+        :param item: A chunk, empty at the end of the stream, or an exception
+        :return: None
+        """
+        while not self.__stopped.is_set():
+            try:
+                self.__chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: memoryview) -> int:
+        """
+        The readinto function copies the next bytes of the stream to a buffer.
+
+        :param self: Access the attributes and methods of the class
+        :param buffer: The buffer to fill
+        :return: The number of bytes copied, 0 at the end of the stream
+        """
+        while not self.__chunk:
+            if self.__finished:
+                return 0
+            chunk = self.__chunks.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            self.__finished = not chunk
+            self.__chunk = memoryview(chunk)
+        size = min(len(buffer), len(self.__chunk))
+        buffer[:size] = self.__chunk[:size]
+        self.__chunk = self.__chunk[size:]
+        return size
+
+    def close(self) -> None:
+        """
+        The close function stops the thread and closes the stream.
+
+        :param self: Access the attributes and methods of the class
+        :return: None
+        """
+        if not self.closed:
+            self.__stopped.set()
+            self.__thread.join()
+            self.__stream.close()
+        super().close()
+
+
+def openFasta(file: str, threaded: bool = False) -> BinaryIO:
+    """
+    The openFasta function opens a fasta file in binary mode, gzip and bgzip files are found by
+    their first bytes and decompressed on the fly.
+
+    :param file: Specify the file to read from
+    :param threaded: Read (and decompress) the file in a thread (see BackgroundReader)
+    :return: The binary stream of the content of the file
+    """
+    with open(file, "rb") as f:
+        compressed = f.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+    stream = gzip.open(file, "rb") if compressed else open(file, "rb")
+    if threaded:
+        return io.BufferedReader(BackgroundReader(stream), CHUNK_SIZE)
+    return stream
+
+
+def iterFasta(file: str, threaded: bool = False) -> Iterator[Sequence]:
+    """
+    The iterFasta function reads a fasta file one record at a time: lines are read from a
+    buffered binary file and only the lines of the current record are kept, so the memory
+    does not depend on the size of the file.
+    Lines before the first header are ignored, gzip files are read as well (see openFasta).
+
+    :param file: Specify the file to read from
+    :param threaded: Read the file in a thread while the records are parsed
+    :return: An iterator over the Sequence objects of the file
+    """
+    with openFasta(file, threaded) as f:
+        identifier, lines = None, []
+        for line in f:
+            if line.startswith(b">"):
+                if identifier is not None:
+                    yield Sequence(identifier, b"".join(lines).decode())
+                identifier, lines = line[1:].rstrip(b"\r\n").decode(), []
+            elif identifier is not None:
+                lines.append(line.rstrip(b"\r\n"))
+        if identifier is not None:
+            yield Sequence(identifier, b"".join(lines).decode())
+
 
 def readFasta(file: str) -> Tuple[str, Sequence]:
     """
     The readFasta function reads a fasta file and returns the sequence in it.
     It takes one argument, which is the name of the fasta file to be read.
-    The function reads this file line by line, starting with the first line
-    (which should have a '>' at its start), and ending with an empty string.
+    Only the first record of the file is read (see iterFasta).
 
     :param file:str: Specify the file to read from
     :return: A tuple of two values, the first is the sequence as a string, the second is a sequence object
     """
-    with open(file, "r") as f:
-        content = "".join(f.readlines())
-        m = re.search(">(.*)\n([\s\S]+?(?=>|$))", content)  # find the first fasta input
-        return m[2].replace("\n", ""), Sequence(m[1], m[2].replace("\n", ""))
+    sequence = next(iterFasta(file))
+    return sequence.sequence, sequence
 
 
-def readFastaMul(file: str) -> Tuple[Sequence]:
+def readFastaMul(file: str, threaded: bool = False) -> Tuple[Sequence]:
     """
     The readFastaMul function reads a FASTA file and returns a tuple of Sequence objects.
     The function takes one argument, the name of the FASTA file to be read.
 
     :param file: Specify the file that is to be read
+    :param threaded: Read the file in a thread while the records are parsed
     :return: A tuple of sequence objects
     """
-    with open(file, "r") as f:
-        content = "".join(f.readlines())
-        return tuple(
-            Sequence(m.group(1), m.group(2).replace("\n", ""))
-            for m in re.finditer(">(.*)\n([\s\S]+?(?=>|$))", content)
-        )
+    return tuple(iterFasta(file, threaded))
+
+
+def buildFastaIndex(file: str, indexFile: str = None) -> str:
+    """
+    The buildFastaIndex function writes the index of a fasta file, like the .fai of samtools:
+    a line per record with its name (first word of the header), its length, the byte offset of
+    its first residue, the number of residues per line and the number of bytes per line.
+    The first line of the index holds the size and the modification time of the fasta file,
+    so that an outdated index is detected (see IndexedFasta).
+    All the lines of a record but the last one must have the same length, empty lines are only
+    allowed at its end. Offsets of gzip files are offsets in their decompressed content.
+
+    :param file: The fasta file
+    :param indexFile: Path of the index, None for the fasta file followed by INDEX_EXTENSION
+    :return: The path of the index
+    """
+    indexFile = indexFile or file + INDEX_EXTENSION
+    status = os.stat(file)
+    records = []
+    with openFasta(file) as f:
+        offset = 0
+        # name, length, offset, bases and width of the current record, then its last line
+        # and whether an empty line ended it
+        record, last, ended = None, None, False
+        for line in f:
+            if line.startswith(b">"):
+                if record is not None:
+                    records.append(record)
+                words = line[1:].split(maxsplit=1)
+                name = words[0].decode() if words else ""
+                record, last, ended = [name, 0, offset + len(line), 0, 0], None, False
+            elif record is not None:
+                bases = len(line.rstrip(b"\r\n"))
+                if not bases:
+                    ended = True
+                elif ended or last not in (None, (record[3], record[4])):
+                    raise ValueError(
+                        f"Lines of different lengths in the record {record[0]}"
+                    )
+                else:
+                    if not record[3]:
+                        record[3], record[4] = bases, len(line)
+                    record[1] += bases
+                    last = (bases, len(line))
+            offset += len(line)
+        if record is not None:
+            records.append(record)
+
+    with open(indexFile, "w") as f:
+        f.write(f"#{status.st_size}\t{status.st_mtime_ns}\n")
+        for record in records:
+            f.write("\t".join(map(str, record)) + "\n")
+    return indexFile
+
+
+class IndexedFasta:
+    def __init__(self, file: str, indexFile: str = None) -> None:
+        """
+        The __init__ function opens a fasta file for random access: its index is read, or built
+        again when it is missing or the fasta file changed since (size or modification time),
+        and the file is memory mapped, so reading a record does not depend on the size of the file.
+        A bgzip file is read by blocks: only the blocks of the residues read are decompressed.
+
+        :param self: Reference the object itself
+        :param file: The fasta file
+        :param indexFile: Path of the index, None for the fasta file followed by INDEX_EXTENSION
+        :return: None
+        """
+        self.file = file
+        self.indexFile = indexFile or file + INDEX_EXTENSION
+        status = os.stat(file)
+        with open(file, "rb") as f:
+            self.__data = (
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if status.st_size
+                else b""
+            )
+        # offsets of the bgzip blocks in the file and in the decompressed content
+        self.__blocks: List[int] = []
+        self.__blockOffsets: List[int] = []
+        self.__lastBlock = (None, b"")
+        if self.__data[: len(GZIP_MAGIC)] == GZIP_MAGIC:
+            self.__readBlocks()
+
+        if not self.__isUpToDate(status):
+            buildFastaIndex(file, self.indexFile)
+        # name -> length, offset, bases and width of each record, in the order of the file
+        self.__records: Dict[str, Tuple[int, int, int, int]] = {}
+        with open(self.indexFile) as f:
+            next(f)
+            for line in f:
+                name, *values = line.rstrip("\n").split("\t")
+                self.__records.setdefault(name, tuple(map(int, values)))
+
+    def __readBlocks(self) -> None:
+        """
+        The __readBlocks function lists the blocks of a bgzip file from their headers, without
+        decompressing them: each header gives the size of its block (BSIZE of the BC field)
+        and each block ends with the size of its content.
+
+        :param self: Access the attributes and methods of the class
+        :return: None
+        """
+        position, offset = 0, 0
+        while position < len(self.__data):
+            flags, extraLength = self.__data[position + 3], 0
+            if flags & 4:
+                (extraLength,) = struct.unpack_from("<H", self.__data, position + 10)
+            field = self.__data[position + 12 : position + 12 + extraLength]
+            start = field.find(b"BC\x02\x00")
+            if start < 0:
+                raise ValueError(
+                    f"{self.file} is gzip but not bgzip, it cannot be indexed"
+                )
+            (size,) = struct.unpack_from("<H", field, start + 4)
+            (length,) = struct.unpack_from("<I", self.__data, position + size - 3)
+            self.__blocks.append(position)
+            self.__blockOffsets.append(offset)
+            position += size + 1
+            offset += length
+
+    def __block(self, index: int) -> bytes:
+        """
+        The __block function decompresses a block of a bgzip file, the last one is kept.
+
+        :param self: Access the attributes and methods of the class
+        :param index: Index of the block
+        :return: Its content
+        """
+        if self.__lastBlock[0] != index:
+            position = self.__blocks[index]
+            (extraLength,) = struct.unpack_from("<H", self.__data, position + 10)
+            end = (
+                self.__blocks[index + 1]
+                if index + 1 < len(self.__blocks)
+                else len(self.__data)
+            )
+            # deflate data between the header and the crc and size of the end of the block
+            content = zlib.decompress(
+                self.__data[position + 12 + extraLength : end - 8], -15
+            )
+            self.__lastBlock = (index, content)
+        return self.__lastBlock[1]
+
+    def __read(self, first: int, last: int) -> Union[mmap.mmap, bytes]:
+        """
+        The __read function reads the bytes first to last (excluded) of the content of the file.
+
+        :param self: Access the attributes and methods of the class
+        :param first: Offset of the first byte
+        :param last: Offset after the last byte
+        :return: The bytes
+        """
+        if not self.__blocks:
+            return self.__data[first:last]
+        index = max(bisect_right(self.__blockOffsets, first) - 1, 0)
+        start, parts = self.__blockOffsets[index], []
+        position = start
+        while position < last and index < len(self.__blocks):
+            parts.append(self.__block(index))
+            position += len(parts[-1])
+            index += 1
+        return b"".join(parts)[first - start : last - start]
+
+    def __isUpToDate(self, status: os.stat_result) -> bool:
+        """
+        The __isUpToDate function checks that the index was built for the current fasta file.
+
+        :param self: Access the attributes and methods of the class
+        :param status: Status of the fasta file
+        :return: True when the index can be used
+        """
+        if not os.path.exists(self.indexFile):
+            return False
+        with open(self.indexFile) as f:
+            header = f.readline()
+        return header == f"#{status.st_size}\t{status.st_mtime_ns}\n"
+
+    def getIds(self) -> List[str]:
+        """
+        The getIds function returns the names of the records, in the order of the file.
+
+        :param self: Access the attributes and methods of the class
+        :return: The names of the records
+        """
+        return list(self.__records)
+
+    def getLength(self, identifier: str) -> int:
+        """
+        The getLength function returns the number of residues of a record.
+
+        :param self: Access the attributes and methods of the class
+        :param identifier: Name of the record
+        :return: Its length
+        """
+        return self.__records[identifier][0]
+
+    def __position(self, identifier: str, index: int) -> int:
+        """
+        The __position function returns the byte offset of a residue of a record in the file.
+
+        :param self: Access the attributes and methods of the class
+        :param identifier: Name of the record
+        :param index: Index of the residue, may be the length of the record
+        :return: The offset
+        """
+        _, offset, bases, width = self.__records[identifier]
+        if not bases:
+            return offset
+        return offset + index // bases * width + index % bases
+
+    def getSlice(
+        self, identifier: str, start: int = 0, stop: int = None
+    ) -> Union[memoryview, bytes]:
+        """
+        The getSlice function returns the residues start to stop (excluded) of a record as bytes.
+        When they are on a single line of a file not compressed, the result is a view of the
+        mapped file, without any copy.
+
+        :param self: Access the attributes and methods of the class
+        :param identifier: Name of the record
+        :param start: Index of the first residue
+        :param stop: Index after the last residue, None for the end of the record
+        :return: The residues
+        """
+        length = self.getLength(identifier)
+        stop = length if stop is None else min(stop, length)
+        start = min(max(start, 0), stop)
+        first = self.__position(identifier, start)
+        last = self.__position(identifier, stop - 1) + 1 if stop > start else first
+        if last - first == stop - start and not self.__blocks:
+            return memoryview(self.__data)[first:last]
+        return self.__read(first, last).replace(b"\n", b"").replace(b"\r", b"")
+
+    def getSequence(self, identifier: str) -> Sequence:
+        """
+        The getSequence function reads a whole record, with its whole header as identifier
+        like iterFasta.
+
+        :param self: Access the attributes and methods of the class
+        :param identifier: Name of the record
+        :return: The sequence
+        """
+        offset = self.__records[identifier][1]
+        # the header is the line before the residues, read backward until its start
+        window = 256
+        while True:
+            start = max(offset - window, 0)
+            header = self.__read(start, offset).rstrip(b"\r\n")
+            newline = header.rfind(b"\n")
+            if newline >= 0 or not start:
+                break
+            window *= 2
+        header = header[newline + 1 :].lstrip(b">")
+        return Sequence(header.decode(), bytes(self.getSlice(identifier)).decode())
+
+    def getRegion(self, identifier: str, start: int, stop: int) -> Sequence:
+        """
+        The getRegion function reads the residues start to stop (excluded) of a record,
+        the identifier of the result is name:start-stop with positions starting at 1 like samtools.
+
+        :param self: Access the attributes and methods of the class
+        :param identifier: Name of the record
+        :param start: Index of the first residue
+        :param stop: Index after the last residue
+        :return: The sequence of the region
+        """
+        residues = bytes(self.getSlice(identifier, start, stop)).decode()
+        return Sequence(f"{identifier}:{start + 1}-{stop}", residues)
+
+    def close(self) -> None:
+        """
+        The close function releases the mapped file.
+
+        :param self: Access the attributes and methods of the class
+        :return: None
+        """
+        if isinstance(self.__data, mmap.mmap):
+            self.__data.close()
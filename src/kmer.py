@@ -0,0 +1,96 @@
+from typing import List
+
+import numpy as np
+
+from .BLOSUM import CODES, encode
+from .sequence import Sequence
+
+# groups of the compressed alphabet of proteins (Dayhoff), B and Z stand for D/N and E/Q
+DAYHOFF = ("AGPST", "C", "DENQBZ", "FWY", "HKR", "ILMV")
+# residues of nucleic acids, their sequences are not compressed
+NUCLEOTIDES = "ACGTUN"
+
+
+def compressCodes(sequences: List[Sequence]) -> List[np.ndarray]:
+    """
+    The compressCodes function converts the residues of the sequences to a small alphabet:
+    the groups of DAYHOFF for proteins, every other residue (gaps, X, *...) being its own group,
+    and the residues themselves for nucleic acids.
+    Letters are numbered from 0 without holes.
+
+    :param sequences: The sequences to convert
+    :return: The letters of each sequence
+    """
+    groups = np.arange(len(CODES))
+    encoded = [sequence.getEncoded() for sequence in sequences]
+    nucleic = encode(NUCLEOTIDES)
+    if not all(np.isin(codes, nucleic).all() for codes in encoded):
+        for group in DAYHOFF:
+            groups[encode(group)] = encode(group)[0]
+    letters = np.unique(
+        groups[np.concatenate(encoded + [np.zeros(0, dtype=np.uint8)])],
+        return_inverse=True,
+    )[1]
+    return np.split(letters, np.cumsum([len(codes) for codes in encoded])[:-1])
+
+
+def kmerCounts(sequences: List[Sequence], k: int) -> np.ndarray:
+    """
+    The kmerCounts function counts the k-mers of the compressed letters of every sequence
+    (see compressCodes) at once, only the k-mers found in at least one sequence get a column.
+
+    :param sequences: The sequences to count
+    :param k: Length of the k-mers
+    :return: A (number of sequences, number of k-mers) numpy array of counts
+    """
+    letters = compressCodes(sequences)
+    lengths = np.array([len(sequence) for sequence in letters])
+    allLetters = np.concatenate(letters + [np.zeros(k, dtype=np.int64)])
+    size = int(allLetters.max()) + 1
+    if size**k >= 1 << 63:
+        raise ValueError(f"{k}-mers of {size} letters do not fit in 64 bits")
+    # the k-mer starting at each position is valid when it does not cross the end of its sequence
+    owners = np.repeat(np.arange(len(sequences)), lengths)
+    valid = np.arange(len(owners)) + k <= np.cumsum(lengths)[owners]
+    identifiers = np.zeros(len(owners), dtype=np.int64)
+    for t in range(k):
+        identifiers = identifiers * size + allLetters[t : t + len(owners)]
+    columns = np.unique(identifiers[valid], return_inverse=True)[1]
+    counts = np.zeros((len(sequences), int(columns.max(initial=-1)) + 1), dtype=np.int32)
+    np.add.at(counts, (owners[valid], columns), 1)
+    return counts
+
+
+def kmerSimilarities(
+    sequences: List[Sequence], k: int, subset: List[int] = None
+) -> np.ndarray:
+    """
+    The kmerSimilarities function estimates how close every pair of sequences is without
+    aligning them, like the first stage of MUSCLE: the number of k-mers shared by both
+    sequences, sum(min(count in x, count in y)), divided by the number of k-mers of the
+    shortest one.
+    The shared counts of all the pairs are the sum over t >= 1 of the products of the
+    matrices (counts >= t), a few matrix products instead of a loop over the pairs.
+    With subset, only the rows of these sequences are computed.
+
+    :param sequences: The sequences to compare
+    :param k: Length of the k-mers
+    :param subset: Indexes of the sequences compared to all the others, None for all of them
+    :return: A (number of sequences in subset, number of sequences) matrix of similarities in [0, 1]
+    """
+    if subset is None:
+        subset = range(len(sequences))
+    subset = np.asarray(subset, dtype=np.int64)
+    counts = kmerCounts(sequences, k)
+    shared = np.zeros((len(subset), len(sequences)))
+    threshold = 1
+    while counts.size:
+        present = (counts >= threshold).astype(np.float64)
+        shared += present[subset] @ present.T
+        threshold += 1
+        # k-mers never found threshold times do not add anything anymore
+        counts = counts[:, (counts >= threshold).any(axis=0)]
+
+    lengths = np.array([sequence.getLength() for sequence in sequences])
+    kmers = np.minimum.outer(lengths[subset], lengths) - k + 1
+    return np.divide(shared, kmers, out=np.zeros_like(shared), where=kmers > 0)
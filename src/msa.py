@@ -1,10 +1,28 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
 from enum import Enum
 from itertools import combinations
 from operator import methodcaller
-from typing import List
+from typing import Iterator, List, Tuple, Union
+
+import numpy as np
 
 from .alignement import Alignment
-from .sequence import Sequence
+from .BLOSUM import GAP_CODE, sumOfPairsTable
+from .cache import ScoreCache
+from .kmer import kmerSimilarities
+from .sequence import GroupSequences, Sequence
+from .tree import DisjointSet, Node, neighborJoining, upgma
+
+# number of pairs scored at once when the distances are written to a file
+DISTANCE_TILE = 1 << 16
+# bytes of the hash of the sequences and settings at the start of the distance file
+DISTANCE_HEADER = 32
 
 
 class Algorithm(Enum):
@@ -12,6 +30,74 @@ class Algorithm(Enum):
     SmithWaterman = 2
 
 
+class GuideTree(Enum):
+    Upgma = 1
+    NeighborJoining = 2
+
+
+@dataclass
+class Refinement(object):
+    """What the refinement stage of an msa (see Msa.refine) did"""
+
+    iterations: int = 0
+    # number of iterations whose alignment was kept
+    improvements: int = 0
+    initialScore: float = 0.0
+    finalScore: float = 0.0
+    seconds: float = 0.0
+
+    def getGain(self) -> float:
+        """
+        The getGain function returns how much the sum of pairs score improved.
+
+        :param self: Reference the class itself
+        :return: The final score minus the initial one
+        """
+        return self.finalScore - self.initialScore
+
+
+# Msa copied in each worker of the parallel pairwise stage (see Msa.generateScoreMatrix)
+_worker = None
+
+
+def _initWorker(msa: "Msa") -> None:
+    """
+    The _initWorker function keeps the msa sent to a worker process, so that its sequences
+    are only sent once per worker.
+
+    :param msa: The msa computing its score matrix
+    :return: None
+    """
+    global _worker
+    _worker = msa
+
+
+def _scoreChunk(pairs: List[Tuple[int, int]]) -> List[float]:
+    """
+    The _scoreChunk function computes in a worker the pairwise score of a chunk of pairs.
+
+    :param pairs: Indexes of the two sequences of each pair
+    :return: The score of each pair
+    """
+    return [
+        _worker.getPairwiseScore(_worker.sequences[i], _worker.sequences[j])
+        for i, j in pairs
+    ]
+
+
+def _mergeGroups(
+    first: Union[Sequence, GroupSequences], second: Union[Sequence, GroupSequences]
+) -> GroupSequences:
+    """
+    The _mergeGroups function aligns in a worker two groups of the progressive alignment.
+
+    :param first: First sequence or group
+    :param second: Second sequence or group
+    :return: The merged group
+    """
+    return _worker.mergeGroups(first, second)
+
+
 class Msa:
     def __init__(
         self,
@@ -21,6 +107,17 @@ class Msa:
         mismatch: int = -1,
         gap: int = -7,
         blosum: bool = True,
+        linearSpace: bool = False,
+        gapOpen: int = None,
+        gapExtend: int = None,
+        band: int = None,
+        useProfiles: bool = False,
+        workers: int = None,
+        chunkSize: int = None,
+        kmer: int = None,
+        guideTree: GuideTree = None,
+        cache: ScoreCache = None,
+        distanceFile: str = None,
     ) -> None:
         self.sequences = sequences
         self.scoreMatrix = None
@@ -33,22 +130,59 @@ class Msa:
         self.blosum = blosum
         self.match = match
         self.gap = gap
+        # use the linear space global alignment (NWSHirschberg) and pairwise identities
+        # (see Alignment.NWSIdentity) for large families
+        self.linearSpace = linearSpace
+        # affine gap penalties (GotohFill), used as soon as one of them is given
+        self.gapOpen = gapOpen
+        self.gapExtend = gapExtend
+        self.affine = gapOpen is not None or gapExtend is not None
+        # initial half width of the banded global alignment, None to fill the whole matrix
+        # (the banded result is not certified, see Alignment.NWSIterFill)
+        self.band = band
+        # GotohFill always fills the whole matrices
+        if self.affine and (band is not None or linearSpace):
+            raise ValueError("band and linearSpace do not support affine gaps")
+        # merge groups with all their sequences instead of their best one
+        self.useProfiles = useProfiles
+        # processes of the pairwise stage (1 or None to stay in this process)
+        # and number of pairs sent to a worker at once (None to split them evenly)
+        self.workers = workers
+        self.chunkSize = chunkSize
+        # length of the k-mers of the fast pairwise stage, None to align every pair
+        self.kmer = kmer
+        # merge along a guide tree built from the pairwise scores, None to merge the pairs
+        # from the best score to the worst
+        self.guideTree = guideTree
+        # tree of the merges of align: the guide tree or the tree of the greedy merges
+        self.tree: Node = None
+        # persistent cache of the pairwise scores, only the pairs it misses are aligned
+        self.cache = cache
+        # file of the condensed distances of the guide tree stage, None to keep them in memory
+        if distanceFile is not None and guideTree is None:
+            raise ValueError("distanceFile is only used to build a guide tree")
+        self.distanceFile = distanceFile
 
         self.alignments = None
+        # aligned group of all the sequences, set by align
+        self.alignment: GroupSequences = None
 
     def generateScoreMatrix(self) -> None:
         """
         The generateScoreMatrix function generates a score matrix for the sequences in the alignment.
         The score matrix is a dictionary of tuples, where each tuple contains two sequences and their pairwise alignment score.
+        The scores are computed by __pairwiseScores.
         The function sorts this list by the scores (in descending order), so that it can be used to find an optimal solution for
         the sequence alignments.
 
         :param self: Access the attributes and methods of the class in python
         :return: None
         """
+        pairs = combinations(range(len(self.sequences)), 2)
+        scores = self.__pairwiseScores()
         self.scoreMatrix = {
-            i: self.getPairwiseScore(i[0].sequence, i[1].sequence)
-            for i in combinations(self.sequences, 2)
+            (self.sequences[i], self.sequences[j]): score
+            for (i, j), score in zip(pairs, scores)
         }
         # Sort the score matrix by the score
         self.scoreMatrix = list(
@@ -59,6 +193,276 @@ class Msa:
             )
         )
 
+    def __align(
+        self,
+        first: Union[str, Sequence, GroupSequences],
+        second: Union[str, Sequence, GroupSequences],
+        useProfiles: bool = None,
+    ) -> Alignment:
+        """
+        The __align function aligns two sequences or groups with the algorithm and scores of the msa.
+
+        :param self: Refer to the object of the class
+        :param first: First sequence or group
+        :param second: Second sequence or group
+        :param useProfiles: Merge the groups with all their sequences, None for the setting of the msa
+        :return: The alignment, with aliSeqs filled
+        """
+        alignment = Alignment(
+            first,
+            second,
+            match=self.match,
+            mismatch=self.mismatch,
+            gap=self.gap,
+            gapOpen=self.gapOpen,
+            gapExtend=self.gapExtend,
+            useProfiles=self.useProfiles if useProfiles is None else useProfiles,
+        )
+
+        if self.affine and self.algorithm == Algorithm.NeedlemanWunsch:
+            alignment.GotohFill(useBlosum=self.blosum)
+            alignment.GotohBacktrack()
+        elif self.affine and self.algorithm == Algorithm.SmithWaterman:
+            alignment.GotohFill(useBlosum=self.blosum, local=True)
+            alignment.GotohBacktrack(full=True)
+        elif self.algorithm == Algorithm.NeedlemanWunsch and self.linearSpace:
+            alignment.NWSHirschberg(useBlosum=self.blosum)
+        elif self.algorithm == Algorithm.NeedlemanWunsch:
+            alignment.NWSIterFill(useBlosum=self.blosum, band=self.band)
+            alignment.NWSBacktrack()
+        elif self.algorithm == Algorithm.SmithWaterman:
+            alignment.SWIter(useBlosum=self.blosum)
+            alignment.SWBacktrack(full=True)
+        else:
+            raise ValueError("Algorithm not supported")
+        return alignment
+
+    def __pairwiseScores(self, pairs: List[Tuple[int, int]] = None) -> List[float]:
+        """
+        The __pairwiseScores function computes the score of every pair of sequences,
+        in the order of itertools.combinations, ie a condensed score matrix, or of the given pairs.
+        Sequences are given as is so their cached profiles are reused from one pair to the other.
+        With workers, the pairs are split in chunks of chunkSize scored by a process pool,
+        each worker receiving the sequences once.
+        With kmer, pairs are not aligned, their score is their k-mer similarity (see kmerSimilarities).
+        With cache, the scores of the pairs already seen with the same settings are read from it
+        and only the other pairs are aligned.
+
+        :param self: Access the attributes and methods of the class in python
+        :param pairs: Indexes of the two sequences of each pair, None for all the pairs
+        :return: The list of scores
+        """
+        if self.kmer is not None and pairs is None:
+            # shared k-mers of every pair at once, no alignment at all
+            similarities = kmerSimilarities(self.sequences, self.kmer)
+            return similarities[np.triu_indices(len(self.sequences), 1)].tolist()
+        if self.kmer is not None:
+            # only the rows of the smallest side of the pairs are computed
+            firsts, seconds = {i for i, _ in pairs}, {j for _, j in pairs}
+            side = int(len(seconds) < len(firsts))
+            subset = sorted(seconds if side else firsts)
+            similarities = kmerSimilarities(self.sequences, self.kmer, subset)
+            rows = {index: row for row, index in enumerate(subset)}
+            return [
+                float(similarities[rows[pair[side]], pair[1 - side]]) for pair in pairs
+            ]
+        if pairs is None:
+            pairs = list(combinations(range(len(self.sequences)), 2))
+        if self.cache is None:
+            return self.__scorePairs(pairs)
+
+        settings = self.__scoreSettings()
+        hashes = [
+            hashlib.sha256(sequence.sequence.encode()).hexdigest()
+            for sequence in self.sequences
+        ]
+        keys = [ScoreCache.makeKey(settings, hashes[i], hashes[j]) for i, j in pairs]
+        cached = self.cache.lookup(keys)
+        missing = [index for index, key in enumerate(keys) if key not in cached]
+        scores = self.__scorePairs([pairs[index] for index in missing])
+        self.cache.store((keys[index], score) for index, score in zip(missing, scores))
+        cached.update((keys[index], score) for index, score in zip(missing, scores))
+        return [cached[key] for key in keys]
+
+    def __scorePairs(self, pairs: List[Tuple[int, int]]) -> List[float]:
+        """
+        The __scorePairs function aligns pairs of sequences and returns their pairwise scores,
+        in a process pool when workers is set. The profiles of the sequences are freed after.
+
+        :param self: Access the attributes and methods of the class in python
+        :param pairs: Indexes of the two sequences of each pair
+        :return: The list of scores
+        """
+        if self.workers is None or self.workers <= 1 or len(pairs) < 2:
+            scores = [
+                self.getPairwiseScore(self.sequences[i], self.sequences[j])
+                for i, j in pairs
+            ]
+            # profiles are only reused from one pair of the stage to the other
+            for index in {index for pair in pairs for index in pair}:
+                self.sequences[index].clearProfiles()
+            return scores
+        # chunks of pairs are scored in worker processes, map keeps them in order
+        size = self.chunkSize or -(-len(pairs) // (self.workers * 4))
+        chunks = [pairs[k : k + size] for k in range(0, len(pairs), size)]
+        with ProcessPoolExecutor(
+            self.workers, initializer=_initWorker, initargs=(self,)
+        ) as executor:
+            return [
+                score
+                for chunk in executor.map(_scoreChunk, chunks)
+                for score in chunk
+            ]
+
+    def generateGuideTree(self) -> None:
+        """
+        The generateGuideTree function builds the guide tree of the sequences with the method of
+        guideTree, from the condensed matrix of the distances 1 - pairwise score.
+        The score dict is filled from the same scores, without building the score matrix.
+        The tree is built from float32 distances, that it overwrites (see upgma): with
+        distanceFile, a copy of the file next to it.
+
+        :param self: Access the attributes and methods of the class in python
+        :return: None
+        """
+        build = upgma if self.guideTree == GuideTree.Upgma else neighborJoining
+        if self.distanceFile is not None:
+            distances = self.generateDistanceMatrix()
+            # sums of the scores read one row of the condensed matrix at a time
+            totals = np.zeros(len(self.sequences))
+            for i, start, stop in self.__condensedRows():
+                scores = 1 - distances[start:stop].astype(np.float64)
+                totals[i] += scores.sum()
+                totals[i + 1 :] += scores
+            self.scoreDict = dict(zip(self.sequences, totals.tolist()))
+            if not len(distances):
+                self.tree = build(distances, self.sequences)
+                return
+            # the tree overwrites its distances: it works on a scratch copy on disk, so that
+            # the file keeps the distances to be resumed and the memory stays bounded
+            descriptor, scratch = tempfile.mkstemp(
+                suffix=".tree", dir=os.path.dirname(os.path.abspath(self.distanceFile))
+            )
+            os.close(descriptor)
+            try:
+                shutil.copyfile(self.distanceFile, scratch)
+                copy = np.memmap(
+                    scratch,
+                    dtype=np.float32,
+                    mode="r+",
+                    offset=DISTANCE_HEADER,
+                    shape=len(distances),
+                )
+                self.tree = build(copy, self.sequences)
+                del copy
+            finally:
+                os.remove(scratch)
+            return
+
+        scores = np.array(self.__pairwiseScores(), dtype=np.float64)
+        rows, columns = np.triu_indices(len(self.sequences), 1)
+        totals = np.bincount(rows, scores, len(self.sequences)) + np.bincount(
+            columns, scores, len(self.sequences)
+        )
+        self.scoreDict = dict(zip(self.sequences, totals.tolist()))
+        self.tree = build((1 - scores).astype(np.float32), self.sequences)
+
+    def generateDistanceMatrix(self) -> np.ndarray:
+        """
+        The generateDistanceMatrix function writes the condensed matrix of the distances
+        1 - pairwise score to distanceFile, a memory mapped float32 array, so that only a tile
+        of DISTANCE_TILE pairs is in memory at once.
+        Tiles not computed yet are NaN in the file: when the file is already there, eg after an
+        interrupted run, and starts with the same hash of the sequences and of the settings (see
+        __distanceKey), only its missing tiles are computed, otherwise it is written again.
+
+        :param self: Access the attributes and methods of the class in python
+        :return: The memory mapped condensed distances
+        """
+        count = len(self.sequences) * (len(self.sequences) - 1) // 2
+        if not count:
+            return np.zeros(0, dtype=np.float32)
+        key = self.__distanceKey()
+        resume = (
+            os.path.exists(self.distanceFile)
+            and os.path.getsize(self.distanceFile) == DISTANCE_HEADER + count * 4
+        )
+        if resume:
+            with open(self.distanceFile, "rb") as file:
+                resume = file.read(DISTANCE_HEADER) == key
+        distances = np.memmap(
+            self.distanceFile,
+            dtype=np.float32,
+            mode="r+" if resume else "w+",
+            offset=DISTANCE_HEADER,
+            shape=count,
+        )
+        if not resume:
+            distances[:] = np.nan
+            distances.flush()
+            # the header is written last, a file interrupted before is never resumed
+            with open(self.distanceFile, "r+b") as file:
+                file.write(key)
+
+        # tiles are made of whole rows of the condensed matrix
+        rows, tileStart = [], 0
+        for i, start, stop in self.__condensedRows():
+            rows.append(i)
+            if stop - tileStart < DISTANCE_TILE and i < len(self.sequences) - 2:
+                continue
+            if np.isnan(distances[tileStart:stop]).any():
+                pairs = [
+                    (row, j) for row in rows for j in range(row + 1, len(self.sequences))
+                ]
+                distances[tileStart:stop] = 1 - np.array(self.__pairwiseScores(pairs))
+                distances.flush()
+            rows, tileStart = [], stop
+        return distances
+
+    def __scoreSettings(self) -> str:
+        """
+        The __scoreSettings function describes everything a pairwise score depends on,
+        the same text for the cache of the scores and the distance file.
+
+        :param self: Access the attributes and methods of the class in python
+        :return: The description of the settings
+        """
+        return (
+            f"{self.algorithm.name} match={self.match} mismatch={self.mismatch} "
+            f"gap={self.gap} blosum={self.blosum} "
+            f"gapOpen={self.gapOpen} gapExtend={self.gapExtend} band={self.band} "
+            f"linearSpace={self.linearSpace} kmer={self.kmer}"
+        )
+
+    def __distanceKey(self) -> bytes:
+        """
+        The __distanceKey function hashes the sequences, in order, and everything their
+        distances depend on, to recognize a distance file written for them.
+
+        :param self: Access the attributes and methods of the class in python
+        :return: The sha256 digest, DISTANCE_HEADER bytes
+        """
+        digest = hashlib.sha256()
+        for text in (self.__scoreSettings(), *(sequence.sequence for sequence in self.sequences)):
+            part = text.encode()
+            # lengths keep the parts apart, like ScoreCache.makeKey
+            digest.update(len(part).to_bytes(8, "little") + part)
+        return digest.digest()
+
+    def __condensedRows(self) -> Iterator[Tuple[int, int, int]]:
+        """
+        The __condensedRows function yields where the pairs (i, j > i) of each sequence i are
+        in the condensed matrix.
+
+        :param self: Access the attributes and methods of the class in python
+        :return: An iterator over i and the start and end of its pairs
+        """
+        start = 0
+        for i in range(len(self.sequences) - 1):
+            stop = start + len(self.sequences) - 1 - i
+            yield i, start, stop
+            start = stop
+
     def generateScoreDict(self) -> None:
         """
         Generate the score dict in order to find the best representing sequence,
@@ -82,75 +486,476 @@ class Msa:
         :param sesq2: Second sequence
         :return: Score which is equal to the number of matches divided by length of sequence.
         """
+        if self.affine:
+            # number of matches / length of the alignment
+            return self.__align(sesq1, sesq2).getIdentity()
+
         alignment = Alignment(
             sesq1, sesq2, match=self.match, mismatch=self.mismatch, gap=self.gap
         )
 
+        # number of matches / length of the alignment, without the matrices in linear space
         if self.algorithm == Algorithm.NeedlemanWunsch:
-            alignment.NWSIterFill(useBlosum=self.blosum)
-            alignment.NWSBacktrack()
+            return alignment.NWSIdentity(
+                useBlosum=self.blosum, band=self.band, linearSpace=self.linearSpace
+            )
         elif self.algorithm == Algorithm.SmithWaterman:
-            alignment.SWIter(useBlosum=self.blosum)
-            alignment.SWBacktrack(full=True)
+            return alignment.SWIdentity(
+                useBlosum=self.blosum, linearSpace=self.linearSpace
+            )
         else:
             raise ValueError("Algorithm not supported")
 
-        # number of matches / length of the sequences
-        return (
-            sum(
-                alignment.aliSeqs.getSequence(0).getIndex(k)
-                == alignment.aliSeqs.getSequence(1).getIndex(k)
-                for k in range(alignment.aliSeqs.getLength())
-            )
-            / alignment.aliSeqs.getLength()
-        )
-
     def align(self) -> None:
         """
-        Align the sequences by following the score matrix.
+        Align the sequences by following the score matrix,
+        or the guide tree from its leaves to its root when guideTree is set.
+        Both give a tree of merges, run by __mergeTree.
 
         :param self: Access the attributes and methods of the class
         :return: Nothing
         """
-        # First, we need to generate the score matrix
-        self.generateScoreMatrix()
-        # Then, we need to generate the score dict in order to find the best representing sequence
-        self.generateScoreDict()
+        if self.guideTree is not None:
+            self.generateGuideTree()
+            root = self.tree
+        else:
+            # First, we need to generate the score matrix
+            self.generateScoreMatrix()
+            # Then, we need to generate the score dict in order to find the best representing sequence
+            self.generateScoreDict()
+            root = self.tree = self.__greedyTree()
+
+        if root is None or root.isLeaf():
+            return
+        self.alignment = self.__mergeTree(root)
+        for sequence in self.sequences:
+            sequence.clearProfiles()
+        # We update the seqManagement dict to keep track of current position of each sequence
+        for key in self.alignment.getOriginalSequences():
+            self.seqManagement[key] = self.alignment
 
-        # We parse paires of sequences from best to worst
+    def __greedyTree(self) -> Node:
+        """
+        The __greedyTree function gives the merges of the score matrix as a tree: pairs of
+        sequences are parsed from best to worst, and the groups of both sequences are merged
+        when they are not already the same.
+        Which groups are merged does not depend on the alignments, so the tree is known
+        before aligning anything.
+        Groups are tracked by a DisjointSet of the indexes of the sequences, so checking a pair
+        and merging two groups are O(alpha(N)).
+
+        :param self: Access the attributes and methods of the class
+        :return: The root of the tree, None without sequences
+        """
+        indexes = {sequence: index for index, sequence in enumerate(self.sequences)}
+        groups = DisjointSet(len(self.sequences))
+        # node of each group, at the index of its representative
+        nodes = [Node(sequence) for sequence in self.sequences]
+        root = nodes[0] if nodes else None
         for pair in self.scoreMatrix:
+            first = groups.find(indexes[pair[0][0]])
+            second = groups.find(indexes[pair[0][1]])
             # We check if the first both sequence are not already in the same group
-            if self.seqManagement[pair[0][0]] != self.seqManagement[pair[0][1]]:
-                alignment = Alignment(
-                    self.seqManagement[pair[0][0]],
-                    self.seqManagement[pair[0][1]],
-                    match=self.match,
-                    mismatch=self.mismatch,
-                    gap=self.gap,
-                )
-                if self.algorithm == Algorithm.NeedlemanWunsch:
-                    alignment.NWSIterFill(useBlosum=self.blosum)
-                    alignment.NWSBacktrack()
-                elif self.algorithm == Algorithm.SmithWaterman:
-                    alignment.SWIter(useBlosum=self.blosum)
-                    alignment.SWBacktrack(full=True)
-                else:
-                    raise ValueError("Algorithm not supported")
-
-                self.alignment = alignment.aliSeqs
-
-                # We set the best sequence of group in fucntion of sum of pairwise score (we take the best score)
-                currectScoreDict = {
-                    i: self.scoreDict[i]
-                    for i in alignment.aliSeqs.getOriginalSequences()
-                }
-                alignment.aliSeqs.setBestSequence(
-                    max(currectScoreDict, key=currectScoreDict.get)
+            if first != second:
+                root = Node(left=nodes[first], right=nodes[second])
+                nodes[groups.union(first, second)] = root
+        return root
+
+    def __mergeTree(self, root: Node) -> GroupSequences:
+        """
+        The __mergeTree function aligns the groups of a tree of merges from its leaves to its root.
+        With workers, every merge whose children are aligned is sent to a process pool, so merges
+        of disjoint groups run at the same time: only the depth of the tree is sequential.
+        The result is the same as aligning the nodes one after the other.
+
+        :param self: Access the attributes and methods of the class
+        :param root: Root of the tree, an inner node
+        :return: The group of all the sequences of the tree
+        """
+        # aligned group of each node whose parent is not aligned yet
+        groups = {}
+        if self.workers is None or self.workers <= 1:
+            for node in root.postOrder():
+                if node.isLeaf():
+                    groups[id(node)] = node.sequence
+                    continue
+                groups[id(node)] = self.mergeGroups(
+                    groups.pop(id(node.left)), groups.pop(id(node.right))
                 )
+                self.__setBestSequence(groups[id(node)])
+            return groups[id(root)]
+
+        parents = {}
+        ready = []
+        for node in root.postOrder():
+            if node.isLeaf():
+                groups[id(node)] = node.sequence
+                continue
+            parents[id(node.left)] = parents[id(node.right)] = node
+            if node.left.isLeaf() and node.right.isLeaf():
+                ready.append(node)
+
+        running = {}
+        with ProcessPoolExecutor(
+            self.workers, initializer=_initWorker, initargs=(self,)
+        ) as executor:
+            while ready or running:
+                for node in ready:
+                    first = groups.pop(id(node.left))
+                    second = groups.pop(id(node.right))
+                    future = executor.submit(_mergeGroups, first, second)
+                    running[future] = (node, first, second)
+                ready = []
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node, first, second = running.pop(future)
+                    group = future.result()
+                    # the worker returns copies, the group gets back the sequences of this process
+                    group.originalSequences = [
+                        original
+                        for part in (first, second)
+                        for original in (
+                            part.getOriginalSequences()
+                            if isinstance(part, GroupSequences)
+                            else [part]
+                        )
+                    ]
+                    self.__setBestSequence(group)
+                    groups[id(node)] = group
+                    parent = parents.get(id(node))
+                    if parent is not None and all(
+                        id(child) in groups for child in (parent.left, parent.right)
+                    ):
+                        ready.append(parent)
+        return groups[id(root)]
+
+    def mergeGroups(
+        self,
+        first: Union[Sequence, GroupSequences],
+        second: Union[Sequence, GroupSequences],
+    ) -> GroupSequences:
+        """
+        The mergeGroups function aligns two groups of the progressive alignment,
+        its best sequence is set by the caller.
+
+        :param self: Access the attributes and methods of the class
+        :param first: First sequence or group
+        :param second: Second sequence or group
+        :return: The merged group
+        """
+        return self.__align(first, second).aliSeqs
+
+    def getSumOfPairs(
+        self, counts: np.ndarray = None, matrix: np.ndarray = None, openings: int = None
+    ) -> float:
+        """
+        The getSumOfPairs function scores the alignment by the sum over its columns of the scores
+        of all the pairs of sequences: the score of both residues, gap for a residue against a gap
+        and 0 for two gaps (see sumOfPairsTable), like the profiles of the alignments of groups.
+        It only needs the counts of the columns.
+        With affine gaps, a residue against a gap costs gapExtend and each gap of each pair of
+        sequences costs gapOpen - gapExtend more (see __gapOpenings), the gaps of a pair being
+        counted without the columns where both sequences have a gap, like GotohFill.
+
+        :param self: Access the attributes and methods of the class
+        :param counts: Counts of the columns (see getColumnCounts), None for the alignment
+        :param matrix: Codes of the rows (see getMatrix) for affine gaps, None for the alignment
+        :param openings: Number of gaps of all the pairs when already known, None to count them
+        :return: The sum of pairs score
+        """
+        if counts is None:
+            counts = self.alignment.getColumnCounts()
+        opening = self.gap if self.gapOpen is None else self.gapOpen
+        extension = self.gap if self.gapExtend is None else self.gapExtend
+        used = np.flatnonzero(counts.any(axis=1))
+        gap = extension if self.affine else self.gap
+        table = sumOfPairsTable(self.match, self.mismatch, self.blosum, gap)
+        table = table[np.ix_(used, used)].astype(np.float64)
+        counts = counts[used].astype(np.float64)
+        # every pair of a column, minus each sequence paired with itself
+        pairs = (counts * (table @ counts)).sum() - (np.diag(table) @ counts).sum()
+        score = float(pairs / 2)
+        if self.affine and opening != extension:
+            if openings is None:
+                if matrix is None:
+                    matrix = self.alignment.getMatrix()
+                openings = self.__gapOpenings(matrix)
+            score += (opening - extension) * openings
+        return score
+
+    def __gapOpenings(
+        self, matrix: np.ndarray, firsts: List[int] = None, seconds: List[int] = None
+    ) -> int:
+        """
+        The __gapOpenings function counts the gaps of every pair of rows of an alignment, once
+        the columns where both rows have a gap are removed: a gap is a run of columns where only
+        one row of the pair has a gap, always the same one.
+        A row is compared to all the next ones at once, or with firsts and seconds, each row of
+        the smallest side to all the rows of the other one.
+
+        :param self: Access the attributes and methods of the class
+        :param matrix: Codes of the rows (see GroupSequences.getMatrix)
+        :param firsts: Rows of one side of the pairs, None for all the pairs
+        :param seconds: Rows of the other side of the pairs
+        :return: The number of gaps of the pairs
+        """
+        if firsts is None:
+            pairs = [(row, slice(row + 1, None)) for row in range(len(matrix) - 1)]
+        else:
+            firsts, seconds = sorted((firsts, seconds), key=len)
+            pairs = [(row, seconds) for row in firsts]
+        gaps = (matrix == GAP_CODE).astype(np.int8)
+        columns = np.arange(matrix.shape[1])
+        openings = 0
+        for row, others in pairs:
+            # 1: gap in the row only, 2: gap in the other row only, 3: gap in both
+            states = gaps[row] + 2 * gaps[others]
+            # state of the last column before, where both rows do not have a gap
+            last = np.maximum.accumulate(np.where(states != 3, columns, -1), axis=1)
+            previous = np.zeros_like(states)
+            previous[:, 1:] = np.take_along_axis(
+                states, np.maximum(last[:, :-1], 0), axis=1
+            )
+            previous[:, 1:][last[:, :-1] < 0] = 0
+            opened = (states != 0) & (states != 3) & (states != previous)
+            openings += int(np.count_nonzero(opened))
+        return openings
+
+    def refine(self, seconds: float = None, iterations: int = None) -> Refinement:
+        """
+        The refine function improves the alignment like the last stage of MUSCLE: the tree of the
+        merges is cut at an edge, the two groups of sequences are taken out of the alignment
+        (without their columns of gaps) and aligned again with their profiles, the new alignment
+        is kept when its sum of pairs score (see getSumOfPairs) is better.
+        Edges are visited in turn until the time or the number of iterations is over, or until
+        no edge improves the alignment anymore.
+        The counts of the columns of the alignment are kept: only the smallest group is counted,
+        the other one is the difference, so an iteration costs about one profile alignment.
+        With affine gaps the number of gaps of the pairs is kept as well, only the pairs across
+        both groups are counted again.
+
+        :param self: Access the attributes and methods of the class
+        :param seconds: Maximum duration of the stage, None for no limit
+        :param iterations: Maximum number of iterations, None for no limit
+        :return: What the stage did
+        """
+        if self.alignment is None:
+            raise ValueError("The msa is not aligned, align it before refining it")
+        start = time.perf_counter()
+        counts = self.alignment.getColumnCounts()
+        # gaps of all the pairs for the affine sum of pairs (see __gapOpenings)
+        openings = self.__gapOpenings(self.alignment.getMatrix()) if self.affine else 0
+        report = Refinement(initialScore=self.getSumOfPairs(counts, openings=openings))
+        report.finalScore = report.initialScore
+        if self.tree is None or self.tree.isLeaf():
+            return report
+        # both children of the root give the same groups, the left one is enough
+        edges = [node for node in self.tree.postOrder() if node is not self.tree.right]
+        edges.pop()
+        unchanged = 0
+        while unchanged < len(edges):
+            if iterations is not None and report.iterations >= iterations:
+                break
+            if seconds is not None and time.perf_counter() - start >= seconds:
+                break
+            node = edges[report.iterations % len(edges)]
+            report.iterations += 1
+            group, score, groupOpenings = self.__realign(node, counts, openings)
+            if score > report.finalScore:
+                self.alignment = group
+                counts = group.getColumnCounts()
+                openings = groupOpenings
+                report.finalScore = score
+                report.improvements += 1
+                unchanged = 0
+            else:
+                unchanged += 1
+
+        if report.improvements:
+            self.__setBestSequence(self.alignment)
+            for key in self.alignment.getOriginalSequences():
+                self.seqManagement[key] = self.alignment
+        report.seconds = time.perf_counter() - start
+        return report
+
+    def __realign(
+        self, node: Node, counts: np.ndarray, openings: int
+    ) -> Tuple[GroupSequences, float, int]:
+        """
+        The __realign function aligns again the sequences under a node of the tree with the other
+        ones, the rows keep the order of the alignment.
+
+        :param self: Access the attributes and methods of the class
+        :param node: The node, that is not the root
+        :param counts: Counts of the columns of the alignment
+        :param openings: Number of gaps of the pairs of the alignment, with affine gaps
+        :return: The new alignment, its sum of pairs score and the number of gaps of its pairs
+        """
+        originals = self.alignment.getOriginalSequences()
+        inside = {id(leaf.sequence) for leaf in node.postOrder() if leaf.isLeaf()}
+        sides = ([], [])
+        for index, original in enumerate(originals):
+            sides[id(original) not in inside].append(index)
+        # the smallest group is counted, the other one is what is left of the alignment
+        small = min(sides, key=len)
+        smallCounts = GroupSequences(
+            [self.alignment.sequences[index] for index in small]
+        ).getColumnCounts()
+        matrix = self.alignment.getMatrix()
+        parts = []
+        for indexes in sides:
+            partCounts = smallCounts if indexes is small else counts - smallCounts
+            kept = partCounts[GAP_CODE] < len(indexes)
+            group = GroupSequences([originals[index] for index in indexes])
+            group.setFromMatrix(matrix[indexes][:, kept])
+            group.setColumnCounts(partCounts[:, kept])
+            group.indexOfBestSequence = 0
+            parts.append(group)
+
+        merged = self.__align(parts[0], parts[1], useProfiles=True).aliSeqs
+        # back to the order of the rows of the alignment
+        order = np.argsort(sides[0] + sides[1])
+        rows = merged.getMatrix()[order]
+        merged.originalSequences = [merged.originalSequences[k] for k in order]
+        merged.setFromMatrix(rows)
+        if self.affine:
+            # the pairs inside a group keep their gaps, only the pairs across both change
+            openings += self.__gapOpenings(rows, *sides)
+            openings -= self.__gapOpenings(matrix, *sides)
+        score = self.getSumOfPairs(merged.getColumnCounts(), openings=openings)
+        return merged, score, openings
+
+    @classmethod
+    def fromAlignment(
+        cls, alignment: GroupSequences, algorithm: Algorithm, **settings
+    ) -> "Msa":
+        """
+        The fromAlignment function builds the msa of an aligned group, eg read from a file,
+        so that sequences can be added to it with addSequences.
+        The sequences of the msa are the rows without their gaps, their pairwise scores
+        are not computed: they only get the scores of the sequences added later.
+
+        :param cls: The class Msa
+        :param alignment: The aligned group
+        :param algorithm: Algorithm of the alignments
+        :param settings: Other parameters of Msa
+        :return: The msa, aligned
+        """
+        sequences = [
+            Sequence(row.id, row.sequence.replace("-", ""))
+            for row in alignment.sequences
+        ]
+        msa = cls(sequences, algorithm, **settings)
+        msa.alignment = GroupSequences(sequences)
+        msa.alignment.setFromMatrix(alignment.getMatrix())
+        msa.alignment.indexOfBestSequence = alignment.indexOfBestSequence
+        msa.scoreDict = dict.fromkeys(sequences, 0)
+        msa.seqManagement = dict.fromkeys(sequences, msa.alignment)
+        return msa
+
+    def addSequences(self, sequences: List[Sequence]) -> None:
+        """
+        The addSequences function adds sequences to the alignment without aligning it again.
+        Only the pairs made by a new sequence are scored: O(k.N) pairs for k new sequences.
+        Each new sequence is put in the guide tree, when there is one, next to its closest
+        sequence, then aligned to the profile of the whole alignment: the columns of the
+        alignment are kept, gap columns are only inserted in front of residues it cannot match.
+        When the msa was never aligned, its sequences are aligned first (see align).
+
+        :param self: Access the attributes and methods of the class
+        :param sequences: The sequences to add
+        :return: None
+        """
+        if self.alignment is None and len(self.sequences) > 1:
+            self.align()
+        existing = len(self.sequences)
+        self.sequences = self.sequences + list(sequences)
+        pairs = [
+            (i, j) for j in range(existing, len(self.sequences)) for i in range(j)
+        ]
+        scores = self.__pairwiseScores(pairs)
+
+        if self.scoreDict is None:
+            self.scoreDict = {}
+        best = {}
+        for (i, j), score in zip(pairs, scores):
+            for index in (i, j):
+                sequence = self.sequences[index]
+                self.scoreDict[sequence] = self.scoreDict.get(sequence, 0) + score
+            if j not in best or score > best[j][1]:
+                best[j] = (i, score)
+
+        current = self.alignment
+        if current is None and existing:
+            # a single sequence is not aligned to anything
+            current = self.sequences[0]
+        for index, sequence in enumerate(sequences, existing):
+            if self.tree is not None and index in best:
+                self.__insertLeaf(sequence, *best[index])
+            if current is None:
+                current = sequence
+                continue
+            current = self.alignment = self.__align(
+                current, sequence, useProfiles=True
+            ).aliSeqs
+            self.__setBestSequence(current)
+
+        self.seqManagement = {
+            sequence: self.seqManagement.get(sequence, sequence)
+            for sequence in self.sequences
+        }
+        if isinstance(current, GroupSequences):
+            self.seqManagement.update(
+                dict.fromkeys(current.getOriginalSequences(), current)
+            )
+
+    def __insertLeaf(self, sequence: Sequence, closest: int, score: float) -> None:
+        """
+        The __insertLeaf function puts a new sequence in the guide tree: the leaf of its closest
+        sequence is replaced by a node joining both leaves, which split the distance between them.
+
+        :param self: Access the attributes and methods of the class
+        :param sequence: The new sequence
+        :param closest: Index of its closest sequence
+        :param score: Pairwise score of both sequences
+        :return: None
+        """
+        target = self.sequences[closest]
+        leaf = Node(sequence, length=(1 - score) / 2)
+        for node in self.tree.postOrder():
+            for child in ("left", "right"):
+                sibling = getattr(node, child)
+                if sibling is not None and sibling.sequence is target:
+                    joined = Node(
+                        left=sibling,
+                        right=leaf,
+                        length=max(0.0, sibling.length - leaf.length),
+                    )
+                    sibling.length = leaf.length
+                    setattr(node, child, joined)
+                    return
+        # the closest sequence is the root, ie the only leaf of the tree
+        self.tree = Node(left=self.tree, right=leaf)
+        self.tree.left.length = leaf.length
+
+    def __setBestSequence(self, group: GroupSequences) -> None:
+        """
+        The __setBestSequence function sets the best sequence of a group made by an alignment.
+
+        :param self: Access the attributes and methods of the class
+        :param group: The group that merged two groups
+        :return: Nothing
+        """
+        # We set the best sequence of group in fucntion of sum of pairwise score (we take the best score)
+        currectScoreDict = {i: self.scoreDict[i] for i in group.getOriginalSequences()}
+        group.setBestSequence(max(currectScoreDict, key=currectScoreDict.get))
 
-                # We update the seqManagement dict to keep track of current position of each sequence
-                for key in alignment.aliSeqs.getOriginalSequences():
-                    self.seqManagement[key] = alignment.aliSeqs
+    def __getstate__(self) -> dict:
+        # workers only need the sequences and the settings, the groups and the tree stay here
+        state = self.__dict__.copy()
+        for name in ("scoreMatrix", "scoreDict", "seqManagement", "tree", "alignment"):
+            state[name] = None
+        return state
 
     def __repr__(self) -> str:
         return str(self.alignment)
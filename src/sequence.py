@@ -1,45 +1,103 @@
 from textwrap import shorten
-from typing import List
+from typing import List, Union
+
+import numpy as np
+
+from .BLOSUM import CHARACTERS, CODES, PROFILE_SIZE, decode, encode, scoreTable
 
 
 class Sequence:
-    def __init__(self, identifier: str, sequence: str) -> None:
+    # residues are only stored as codes, one byte each
+    __slots__ = ("id", "numberOfSequences", "__codes", "__profiles")
+
+    def __init__(self, identifier: str, sequence: Union[str, np.ndarray]) -> None:
         self.id = identifier
         self.sequence = sequence
         self.numberOfSequences = 1
 
-    def getIndex(self, index: int) -> str:
+    @property
+    def sequence(self) -> str:
+        return decode(self.__codes)
+
+    @sequence.setter
+    def sequence(self, sequence: Union[str, np.ndarray]) -> None:
+        # residues as a string, or already encoded, eg a row of the matrix of a group
+        if isinstance(sequence, str):
+            self.__codes = encode(sequence)
+        else:
+            self.__codes = np.asarray(sequence, dtype=np.uint8)
+        # profiles are built lazily and dropped when residues change
+        self.__profiles = {}
+
+    def getEncoded(self) -> np.ndarray:
         """
-        The getIndex function returns the index of a given value in the list.
+        The getEncoded function returns the residues encoded as small integers (see BLOSUM.encode),
+        the codes are how the residues are stored so nothing is computed.
 
         :param self: Access the attributes and methods of the class
-        :param index:int: Specify the index of the element in the list to be returned
-        :return: The value of the indexth element in the list
+        :return: A uint8 numpy array of codes
         """
-        return self.sequence[index]
+        return self.__codes
 
-    def getLength(self) -> int:
-        return len(self.sequence)
+    def getProfile(self, match: int, mismatch: int, useBlosum: bool) -> np.ndarray:
+        """
+        The getProfile function returns the query profile of the sequence: for every residue code
+        of the alphabet and the gap, the score against each position of the sequence.
+        profile[code] is a whole row of the alignment matrix, the profile is cached for each scoring
+        (see clearProfiles) in the smallest integers that hold the scores, int16 in practice.
 
-    def getEmptySequence(self):
+        :param self: Access the attributes and methods of the class
+        :param match: Score of a match
+        :param mismatch: Score of a mismatch
+        :param useBlosum: Determine whether the blosum matrix should be used or not
+        :return: A numpy array of shape (PROFILE_SIZE, length of the sequence)
         """
-        The getEmptySequence function returns the sequence with is sequence fields empty, keep only name.
+        key = (match, mismatch, useBlosum)
+        if key not in self.__profiles:
+            table = scoreTable(match, mismatch, useBlosum)[:PROFILE_SIZE]
+            # scores are small, the smallest integers holding them
+            dtype = np.result_type(
+                np.min_scalar_type(int(table.min())),
+                np.min_scalar_type(int(table.max())),
+                np.int16,
+            )
+            self.__profiles[key] = table[:, self.getEncoded()].astype(dtype)
+        return self.__profiles[key]
+
+    def clearProfiles(self) -> None:
+        """
+        The clearProfiles function frees the cached profiles (see getProfile), eg once all the
+        pairs of a stage are aligned.
 
+        :param self: Access the attributes and methods of the class
+        :return: None
+        """
+        self.__profiles = {}
 
-        :param self: Access the attributes and methods of the class in python
-        :return: The empty sequence
+    def getColumnCounts(self) -> np.ndarray:
+        """
+        The getColumnCounts function returns, for every residue code, how many times it appears
+        in each column of the sequence, ie a one hot encoding of its residues.
+
+        :param self: Access the attributes and methods of the class
+        :return: A numpy array of shape (number of codes, length of the sequence)
         """
-        return Sequence(self.id, "")
+        counts = np.zeros((len(CODES), self.getLength()), dtype=np.int64)
+        counts[self.getEncoded(), np.arange(self.getLength())] = 1
+        return counts
 
-    def insertFromBacktrace(self, value: str) -> None:
+    def getIndex(self, index: int) -> str:
         """
-        The insertFromBacktrace function inserts a value into the start of the sequence.
+        The getIndex function returns the index of a given value in the list.
 
-        :param self: Reference the object itself
-        :param value: Value that is being inserted
-        :return: None
+        :param self: Access the attributes and methods of the class
+        :param index:int: Specify the index of the element in the list to be returned
+        :return: The value of the indexth element in the list
         """
-        self.sequence = "".join([value, self.sequence])
+        return chr(CHARACTERS[self.__codes[index]])
+
+    def getLength(self) -> int:
+        return len(self.__codes)
 
     def __repr__(self) -> str:
         """
@@ -53,22 +111,72 @@ class Sequence:
 
 
 class GroupSequences:
+    __slots__ = (
+        "originalSequences",
+        "numberOfSequences",
+        "indexOfBestSequence",
+        "__members",
+        "__matrix",
+        "__rows",
+        "__columnCounts",
+    )
+
     def __init__(self, sequences: List[Sequence]) -> None:
         self.originalSequences: List[Sequence] = []
-        self.sequences: List[Sequence] = []
 
         for i in sequences:
             if isinstance(i, GroupSequences):
-                self.originalSequences = self.originalSequences + i.originalSequences
-                self.sequences = self.sequences + i.sequences
+                self.originalSequences.extend(i.originalSequences)
             else:
                 self.originalSequences.append(i)
-                self.sequences.append(i)
 
-        self.numberOfSequences = len(self.sequences)
+        self.numberOfSequences = len(self.originalSequences)
         self.indexOfBestSequence = -1
 
-        self.beforeAlignment = self.sequences
+        # the matrix of the codes is the only copy of the rows, made from the members once
+        # they are aligned, or set by an alignment (see setFromMatrix)
+        self.__members = list(sequences)
+        self.__matrix = None
+        # rows and counts of the columns of the matrix, computed once
+        self.__rows = None
+        self.__columnCounts = None
+
+    @property
+    def sequences(self) -> List[Sequence]:
+        """
+        The sequences property returns the aligned sequences, views of the rows of the matrix
+        (see getMatrix). Members not aligned yet are returned as they are.
+
+        :param self: Access the attributes and methods of the class
+        :return: A sequence per row
+        """
+        if self.__rows is None:
+            rows = self.__memberRows()
+            if self.__matrix is not None or len({row.getLength() for row in rows}) < 2:
+                rows = [
+                    Sequence(original.id, row)
+                    for original, row in zip(self.originalSequences, self.getMatrix())
+                ]
+            self.__rows = rows
+        return self.__rows
+
+    def __memberRows(self) -> List[Sequence]:
+        """
+        The __memberRows function returns the rows of the members of the group, until the group
+        has a matrix.
+
+        :param self: Access the attributes and methods of the class
+        :return: The rows of the members, empty when the group has a matrix
+        """
+        if self.__matrix is not None:
+            return []
+        return [
+            row
+            for member in self.__members
+            for row in (
+                member.sequences if isinstance(member, GroupSequences) else [member]
+            )
+        ]
 
     def setBestSequence(self, index: Sequence) -> None:
         """
@@ -103,9 +211,7 @@ class GroupSequences:
         :param sequence: Specify the sequence number
         :return: The sequence at the index
         """
-        return self.beforeAlignment[sequence or self.indexOfBestSequence].getIndex(
-            index
-        )
+        return self.sequences[sequence or self.indexOfBestSequence].getIndex(index)
 
     def getSequence(self, index: int) -> Sequence:
         """
@@ -115,42 +221,79 @@ class GroupSequences:
         :param index: Specify which sequence to return
         :return: The sequence at the specified index
         """
-        return self.beforeAlignment[index]
+        return self.sequences[index]
 
-    def getSequencesAtIndex(self, index: int) -> List[str]:
+    def getColumnCounts(self) -> np.ndarray:
         """
-        The getSequencesAtIndex function returns a list of residu that are at the given index for all sequences.
+        The getColumnCounts function returns, for every residue code, how many sequences
+        of the group have it in each column of the alignment (gaps included).
 
+        :param self: Access the attributes and methods of the class
+        :return: A numpy array of shape (number of codes, length of the alignment)
+        """
+        if self.__columnCounts is None:
+            matrix = self.getMatrix()
+            counts = np.zeros((len(CODES), matrix.shape[1]), dtype=np.int64)
+            for code in np.unique(matrix):
+                counts[code] = np.count_nonzero(matrix == code, axis=0)
+            self.__columnCounts = counts
+        return self.__columnCounts
+
+    def setColumnCounts(self, counts: np.ndarray) -> None:
+        """
+        The setColumnCounts function sets the counts of the columns when they are already known,
+        eg computed from the counts of a larger group, so that they are not counted again.
 
+        :param self: Access the attributes and methods of the class
+        :param counts: Counts of the columns (see getColumnCounts)
+        :return: None
+        """
+        self.__columnCounts = counts
 
-        :param self: Access the attributes and methods of the class in which it is used
-        :param index:int: Specify the index of the residu to be returned
-        :return: A list of residu at a given index for all the sequences
+    def getMatrix(self) -> np.ndarray:
         """
-        return [sequence.getIndex(index) for sequence in self.beforeAlignment]
+        The getMatrix function returns the codes of the aligned sequences as a single matrix,
+        a row per sequence (gaps are GAP_CODE), so that a column is a slice.
+        The matrix of members already aligned is made once, their rows are copied.
 
-    def resetForAlignment(self) -> None:
+        :param self: Access the attributes and methods of the class
+        :return: A uint8 numpy array of shape (number of sequences, length of the alignment)
         """
-        The resetForAlignment function reset the sequences to insert data obtained
-        from alignement, and move the previous sequence in the beforeAlignment
-        attribute to be able to check wich sequence is the best one for future
-        alignement.
+        if self.__matrix is None:
+            rows = [row.getEncoded() for row in self.__memberRows()]
+            if len({len(row) for row in rows}) > 1:
+                raise ValueError("The sequences of the group are not aligned")
+            self.__matrix = (
+                np.stack(rows) if rows else np.zeros((0, 0), dtype=np.uint8)
+            )
+            self.__members = []
+        return self.__matrix
+
+    def setFromMatrix(self, matrix: np.ndarray) -> None:
+        """
+        The setFromMatrix function replaces all the sequences by the rows of a matrix of codes,
+        in the order of the original sequences, the matrix becomes the aligned sequences.
 
         :param self: Access variables that belongs to the class
+        :param matrix: A uint8 numpy array of codes, a row per sequence
         :return: None
         """
-        self.beforeAlignment = self.sequences
-        self.sequences = [sequence.getEmptySequence() for sequence in self.sequences]
+        self.__matrix = matrix
+        self.__members = []
+        self.__rows = None
+        self.__columnCounts = None
 
-    def setAsAligned(self) -> None:
+    def getSequencesAtIndex(self, index: int) -> List[str]:
         """
-        The setAsAligned function set beforeAlignment the to be the same as the
-        sequences attribute.
+        The getSequencesAtIndex function returns a list of residu that are at the given index for all sequences.
 
-        :param self: Access variables that belongs to the class
-        :return: None
+
+
+        :param self: Access the attributes and methods of the class in which it is used
+        :param index:int: Specify the index of the residu to be returned
+        :return: A list of residu at a given index for all the sequences
         """
-        self.beforeAlignment = self.sequences
+        return list(decode(self.getMatrix()[:, index]))
 
     def getGroupLength(self) -> int:
         """
@@ -160,7 +303,7 @@ class GroupSequences:
         :return: The length of the group
         """
 
-        return len(self.sequences)
+        return len(self.originalSequences)
 
     def getLength(self, sequence: int = None) -> int:
         """
@@ -172,19 +315,7 @@ class GroupSequences:
         :param sequence=None: Determine if the sequence is being passed in as a parameter or not
         :return: The length of the sequence
         """
-        return self.beforeAlignment[sequence or self.indexOfBestSequence].getLength()
-
-    def insertFromBacktrace(self, value: List[str]) -> None:
-        """
-        The insertFromBacktrace function insert a in all the sequences starting
-        from the end.
-
-        :param self: Access variables that belongs to the class
-        :param value: List of values to be inserted
-        :return: None
-        """
-        for index, sequence in enumerate(self.sequences):
-            sequence.insertFromBacktrace(value[index])
+        return self.sequences[sequence or self.indexOfBestSequence].getLength()
 
     def __repr__(self) -> str:
         names, seqs = [], []
@@ -0,0 +1,300 @@
+from dataclasses import dataclass
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+from .sequence import Sequence
+
+
+@dataclass
+class Node(object):
+    """Node of a guide tree, leaves hold a sequence and inner nodes two children"""
+
+    sequence: Sequence = None
+    left: "Node" = None
+    right: "Node" = None
+    # length of the branch to the parent node
+    length: float = 0.0
+
+    def isLeaf(self) -> bool:
+        """
+        The isLeaf function tells whether the node is a leaf, ie holds a sequence.
+
+        :param self: Reference the class itself
+        :return: True for a leaf
+        """
+        return self.left is None
+
+    def postOrder(self) -> Iterator["Node"]:
+        """
+        The postOrder function yields the nodes of the tree, children before their parent,
+        without recursion so that deep trees are walked as well.
+
+        :param self: Root of the tree
+        :return: An iterator over the nodes
+        """
+        stack: List[Tuple[Node, bool]] = [(self, False)]
+        while stack:
+            node, visited = stack.pop()
+            if visited or node.isLeaf():
+                yield node
+            else:
+                stack += [(node, True), (node.right, False), (node.left, False)]
+
+    def toNewick(self) -> str:
+        """
+        The toNewick function writes the tree in the Newick format, with the identifiers of
+        the sequences as names of the leaves and the lengths of the branches.
+
+        :param self: Root of the tree
+        :return: The Newick string, ending with a semicolon
+        """
+        texts = {}
+        for node in self.postOrder():
+            if node.isLeaf():
+                text = node.sequence.id
+                if any(character in text for character in " ()[]':;,"):
+                    text = "'" + text.replace("'", "''") + "'"
+            else:
+                text = f"({texts.pop(id(node.left))},{texts.pop(id(node.right))})"
+            texts[id(node)] = text if node is self else f"{text}:{node.length:.6g}"
+        return texts[id(self)] + ";"
+
+
+class DisjointSet(object):
+    """Groups of the integers 0..size - 1, merged with union by size and path halving"""
+
+    def __init__(self, size: int) -> None:
+        self.parents = list(range(size))
+        self.sizes = [1] * size
+
+    def find(self, element: int) -> int:
+        """
+        The find function returns the representative of the group of an element, and shortens
+        the path to it on the way: O(alpha(N)) amortized.
+
+        :param self: Reference the class itself
+        :param element: The element
+        :return: The representative of its group
+        """
+        parents = self.parents
+        while parents[element] != element:
+            parents[element] = parents[parents[element]]
+            element = parents[element]
+        return element
+
+    def union(self, first: int, second: int) -> int:
+        """
+        The union function merges the groups of two representatives, the largest one stays the
+        representative.
+
+        :param self: Reference the class itself
+        :param first: Representative of the first group
+        :param second: Representative of the second group
+        :return: The representative of the merged group
+        """
+        if self.sizes[first] < self.sizes[second]:
+            first, second = second, first
+        self.parents[second] = first
+        self.sizes[first] += self.sizes[second]
+        return first
+
+
+# number of distances gathered at once when all the rows are read
+ROWS_BLOCK = 1 << 16
+
+
+def condensedOffsets(size: int) -> np.ndarray:
+    """
+    The condensedOffsets function describes a condensed distance matrix of size sequences,
+    the distances of the pairs (i, j) with i < j in the order of itertools.combinations:
+    the distance (i, j > i) is at offsets[i] + j.
+
+    :param size: Number of sequences
+    :return: The offsets of the rows
+    """
+    rows = np.arange(size, dtype=np.int64)
+    return rows * (2 * size - rows - 1) // 2 - rows - 1
+
+
+def condensedIndexes(
+    offsets: np.ndarray, rows: np.ndarray, columns: np.ndarray
+) -> np.ndarray:
+    """
+    The condensedIndexes function finds the distances (i, j) in a condensed distance matrix,
+    in any order of i and j. Indexes of the diagonal are meaningless.
+
+    :param offsets: The offsets of the rows of the matrix (see condensedOffsets)
+    :param rows: Indexes i, broadcast with columns
+    :param columns: Indexes j
+    :return: The indexes of the distances in the condensed matrix
+    """
+    return offsets[np.minimum(rows, columns)] + np.maximum(rows, columns)
+
+
+def rowBlocks(count: int, width: int) -> List[np.ndarray]:
+    """
+    The rowBlocks function splits rows into blocks of about ROWS_BLOCK distances.
+
+    :param count: Number of rows
+    :param width: Number of distances of a row
+    :return: The indexes of the rows of each block
+    """
+    if not count:
+        return []
+    return np.array_split(np.arange(count), min(count, -(-count * width // ROWS_BLOCK)))
+
+
+def upgma(distances: np.ndarray, sequences: List[Sequence]) -> Node:
+    """
+    The upgma function builds the guide tree of the sequences by UPGMA: the two closest clusters
+    are merged, the distance of the new cluster to another one is the average of the distances
+    between their sequences.
+    The closest cluster of every row is kept up to date, so a merge only updates two rows and
+    the rows that were closest to one of the merged clusters: O(N^2) operations in practice.
+    The distances of the merged clusters are written in place of the first one, so distances
+    is modified and no square matrix is made: it may be a memory mapped file.
+
+    :param distances: The condensed distances of the sequences (see condensedOffsets)
+    :param sequences: The sequences, leaves of the tree
+    :return: The root of the tree
+    """
+    size = len(sequences)
+    nodes = [Node(sequence) for sequence in sequences]
+    if size < 2:
+        return nodes[0] if nodes else None
+    sizes = np.ones(size)
+    heights = np.zeros(size)
+    alive = np.ones(size, dtype=bool)
+    columns = np.arange(size)
+    offsets = condensedOffsets(size)
+
+    def rows(indexes: np.ndarray) -> np.ndarray:
+        # distances of the clusters left, infinite on the diagonal and for removed ones
+        values = distances[condensedIndexes(offsets, indexes[:, None], columns)]
+        values = values.astype(np.float64)
+        values[:, ~alive] = np.inf
+        values[np.arange(len(indexes)), indexes] = np.inf
+        return values
+
+    closest = np.zeros(size, dtype=int)
+    minimums = np.zeros(size)
+    for block in rowBlocks(size, size):
+        values = rows(block)
+        closest[block] = np.argmin(values, axis=1)
+        minimums[block] = values[np.arange(len(block)), closest[block]]
+
+    for _ in range(size - 1):
+        first = int(np.argmin(minimums))
+        second = int(closest[first])
+        first, second = min(first, second), max(first, second)
+        firstRow, secondRow = rows(np.array([first, second]))
+        height = firstRow[second] / 2
+        for child, index in ((nodes[first], first), (nodes[second], second)):
+            child.length = max(0.0, height - heights[index])
+        nodes[first] = Node(left=nodes[first], right=nodes[second])
+        heights[first] = height
+
+        # the merged cluster takes the place of the first one, the second one is removed
+        merged = (sizes[first] * firstRow + sizes[second] * secondRow) / (
+            sizes[first] + sizes[second]
+        )
+        sizes[first] += sizes[second]
+        alive[second] = False
+        merged[second] = np.inf
+        others = np.flatnonzero(np.isfinite(merged))
+        distances[condensedIndexes(offsets, first, others)] = merged[others]
+        minimums[second] = np.inf
+
+        # rows closer to the merged cluster than before, then rows whose closest cluster changed
+        better = merged < minimums
+        closest[better], minimums[better] = first, merged[better]
+        stale = np.flatnonzero(
+            ((closest == first) | (closest == second)) & ~better & np.isfinite(minimums)
+        )
+        stale = np.append(stale, first)
+        values = rows(stale)
+        closest[stale] = np.argmin(values, axis=1)
+        minimums[stale] = values[np.arange(len(stale)), closest[stale]]
+    return nodes[0]
+
+
+def neighborJoining(distances: np.ndarray, sequences: List[Sequence]) -> Node:
+    """
+    The neighborJoining function builds the guide tree of the sequences by neighbor joining:
+    the pair minimising Q(i, j) = (r - 2) * d(i, j) - R(i) - R(j), where r is the number of
+    remaining clusters and R the sums of their distances, is joined at each step.
+    The last two clusters are joined at the root, which is placed in the middle of their branch.
+    The clusters left are the first r rows of distances, which is modified in place: Q is
+    computed by blocks of rows (see rowBlocks) and no square matrix is made.
+
+    :param distances: The condensed distances of the sequences (see condensedOffsets)
+    :param sequences: The sequences, leaves of the tree
+    :return: The root of the tree
+    """
+    size = len(sequences)
+    nodes = [Node(sequence) for sequence in sequences]
+    if size < 2:
+        return nodes[0] if nodes else None
+    remaining = size
+    columns = np.arange(size)
+    offsets = condensedOffsets(size)
+
+    def rows(indexes: np.ndarray) -> np.ndarray:
+        # distances to the clusters left, 0 on the diagonal
+        values = distances[
+            condensedIndexes(offsets, indexes[:, None], columns[:remaining])
+        ].astype(np.float64)
+        values[np.arange(len(indexes)), indexes] = 0
+        return values
+
+    totals = np.zeros(size)
+    for block in rowBlocks(size, size):
+        totals[block] = rows(block).sum(axis=1)
+
+    while remaining > 2:
+        best, first, second = np.inf, 0, 0
+        for block in rowBlocks(remaining, remaining):
+            # the pairs i < j are at offsets[i] + j, the other ones are ignored
+            right = columns[block[0] : remaining]
+            scores = distances[offsets[block, None] + right].astype(np.float64)
+            scores *= remaining - 2
+            scores -= totals[block, None]
+            scores -= totals[None, right]
+            corner = scores[:, : len(block)]
+            corner[np.tril_indices(len(block))] = np.inf
+            index = int(np.argmin(scores))
+            if scores.flat[index] < best:
+                row, column = divmod(index, len(right))
+                best, first = scores.flat[index], int(block[row])
+                second = int(right[column])
+
+        firstRow, secondRow = rows(np.array([first, second]))
+        distance = firstRow[second]
+        firstLength = distance / 2 + (totals[first] - totals[second]) / (
+            2 * (remaining - 2)
+        )
+        nodes[first].length = max(0.0, firstLength)
+        nodes[second].length = max(0.0, distance - firstLength)
+        nodes[first] = Node(left=nodes[first], right=nodes[second])
+
+        # the new cluster takes the place of the first one, the last one the place of the second
+        merged = (firstRow + secondRow - distance) / 2
+        merged[first] = 0
+        totals[:remaining] += merged - firstRow - secondRow
+        totals[first] = merged.sum() - merged[second]
+        last = remaining - 1
+        merged[second] = merged[last]
+        others = np.flatnonzero(columns[:remaining] != first)
+        distances[condensedIndexes(offsets, first, others)] = merged[others]
+        if second != last:
+            lastRow = rows(np.array([last]))[0]
+            others = np.flatnonzero(columns[:last] != second)
+            distances[condensedIndexes(offsets, second, others)] = lastRow[others]
+            totals[second] = totals[last]
+        nodes[second] = nodes[last]
+        nodes.pop()
+        remaining -= 1
+
+    nodes[0].length = nodes[1].length = float(distances[0]) / 2
+    return Node(left=nodes[0], right=nodes[1])
@@ -1,6 +1,9 @@
 from typing import List
 
+import numpy as np
+
 from src.sequence import Sequence
+from .alignement import DirectionFlag
 from .fasta import readFastaMul
 
 PlotMatrix = List[List[str]]
@@ -41,10 +44,16 @@ def drawMatrix(matrix):
     The drawMatrix function draws a matrix of numbers to the screen.
     It takes one argument, a list of lists (a 2D array).
     The function will print each row on its own line.
+    Numpy matrices are converted to lists first so both are drawn the same way,
+    a uint8 matrix is a matDir and each cell is drawn as its list of directions.
 
     :param matrix: Specify the matrix to be drawn
     :return: A string representation of the matrix
     """
+    if isinstance(matrix, np.ndarray) and matrix.dtype == np.uint8:
+        matrix = [[DirectionFlag(int(i)).toDirections() for i in row] for row in matrix]
+    elif isinstance(matrix, np.ndarray):
+        matrix = matrix.tolist()
     return "".join("".join(str(i)) + "\n" for i in matrix)
 
 
@@ -0,0 +1,131 @@
+import random
+
+import numpy as np
+
+import src.alignement
+from src.alignement import Alignment
+from src.benchmark import randomFamily
+from src.BLOSUM import GAP_CODE, encode, scoreTable, sumOfPairsTable
+from src.msa import Algorithm, Msa
+
+
+def test_hirschberg_same_alignment_as_backtrack(monkeypatch):
+    # small blocks, so that the matrices are split many times
+    monkeypatch.setattr(src.alignement, "HIRSCHBERG_BLOCK", 16)
+    generator = random.Random(1)
+    for _ in range(200):
+        alphabet = generator.choice(["AC", "ACGT", "ACDEFGHIKLMNPQRSTVWY"])
+        first, second = (
+            "".join(generator.choices(alphabet, k=generator.randint(0, 40)))
+            for _ in range(2)
+        )
+        settings = dict(
+            match=generator.choice([0, 1, 2]), gap=generator.choice([-1, -2])
+        )
+
+        backtrack = Alignment(first, second, **settings)
+        backtrack.NWSIterFill()
+        backtrack.NWSBacktrack()
+        hirschberg = Alignment(first, second, **settings)
+        hirschberg.NWSHirschberg()
+
+        assert str(hirschberg.aliSeqs) == str(backtrack.aliSeqs)
+        assert hirschberg.bestScore[0] == backtrack.bestScore[0]
+
+
+def test_profile_alignment_scores_columns_by_sum_of_pairs(monkeypatch):
+    monkeypatch.setattr(src.alignement, "HIRSCHBERG_BLOCK", 16)
+    family = randomFamily(7, 30)
+    groups = []
+    for members in (family[:4], family[4:]):
+        msa = Msa(members, Algorithm.NeedlemanWunsch, useProfiles=True)
+        msa.align()
+        groups.append(msa.alignment)
+    gap = -3
+    table = sumOfPairsTable(1, -1, True, gap)
+
+    full = Alignment(*groups, gap=gap, useProfiles=True)
+    full.NWSIterFill(useBlosum=True)
+    full.NWSBacktrack()
+    hirschberg = Alignment(*groups, gap=gap, useProfiles=True)
+    hirschberg.NWSHirschberg(useBlosum=True)
+    assert str(hirschberg.aliSeqs) == str(full.aliSeqs)
+
+    # rows of the first group come first, a column of gaps on one side is a gap move
+    matrix = full.aliSeqs.getMatrix()
+    first, second = matrix[:4], matrix[4:]
+    expected = 0
+    for column in range(matrix.shape[1]):
+        gaps = [(side[:, column] == GAP_CODE).all() for side in (first, second)]
+        if any(gaps):
+            expected += gap * len(first) * len(second)
+        else:
+            expected += table[np.ix_(first[:, column], second[:, column])].sum()
+    assert full.bestScore[0] == hirschberg.bestScore[0] == expected
+
+
+def naiveGotoh(first, second, table, opening, extension, local):
+    # textbook Gotoh: E ends with a gap in the second sequence, F in the first one
+    minimum = float("-inf")
+    first, second = encode(first), encode(second)
+    rows, columns = len(first) + 1, len(second) + 1
+    H = [[minimum] * columns for _ in range(rows)]
+    E = [[minimum] * columns for _ in range(rows)]
+    F = [[minimum] * columns for _ in range(rows)]
+    for i in range(rows):
+        for j in range(columns):
+            if j > 0:
+                E[i][j] = max(E[i][j - 1] + extension, H[i][j - 1] + opening)
+            if i > 0:
+                F[i][j] = max(F[i - 1][j] + extension, H[i - 1][j] + opening)
+            H[i][j] = max(E[i][j], F[i][j])
+            if i > 0 and j > 0:
+                H[i][j] = max(
+                    H[i][j], H[i - 1][j - 1] + table[first[i - 1], second[j - 1]]
+                )
+            if local or i == j == 0:
+                H[i][j] = max(H[i][j], 0)
+    return max(map(max, H)) if local else H[-1][-1]
+
+
+def affineScore(matrix, table, opening, extension):
+    # a run of k gaps costs opening + (k - 1) * extension, or is split into several
+    # gaps when opening is cheaper
+    score, previous = 0, None
+    for column in matrix.T:
+        state = tuple(column == GAP_CODE)
+        if not any(state):
+            score += table[column[0], column[1]]
+        elif state == previous:
+            score += max(opening, extension)
+        else:
+            score += opening
+        previous = state
+    return score
+
+
+def test_gotoh_same_score_as_naive_gotoh():
+    generator = random.Random(2)
+    for _ in range(300):
+        alphabet = generator.choice(["AC", "ACGT", "ACDEFGHIKLMNPQRSTVWY"])
+        first, second = (
+            "".join(generator.choices(alphabet, k=generator.randint(1, 25)))
+            for _ in range(2)
+        )
+        # gapExtend lower than, equal to and higher than gapOpen
+        opening, extension = generator.randint(-8, -1), generator.randint(-8, -1)
+        useBlosum = generator.random() < 0.5
+        local = generator.random() < 0.5
+        table = scoreTable(1, -1, useBlosum)
+
+        alignment = Alignment(
+            first, second, match=1, mismatch=-1, gapOpen=opening, gapExtend=extension
+        )
+        alignment.GotohFill(useBlosum=useBlosum, local=local)
+        alignment.GotohBacktrack()
+        expected = naiveGotoh(first, second, table, opening, extension, local)
+
+        assert alignment.bestScore[0] == expected
+        # the backtracked alignment has the score of the fill
+        matrix = alignment.aliSeqs.getMatrix()
+        assert affineScore(matrix, table, opening, extension) == expected
@@ -0,0 +1,77 @@
+import random
+
+from src.batch import BatchAligner
+from src.msa import Algorithm
+from src.sequence import Sequence
+
+ALPHABET = "ACDEFGHIKLMNPQRSTVWY"
+
+
+def randomSequences(generator, count, prefix):
+    return [
+        Sequence(
+            f"{prefix}{index}",
+            "".join(generator.choices(ALPHABET, k=generator.randint(0, 30))),
+        )
+        for index in range(count)
+    ]
+
+
+def test_score_only_same_scores_as_alignments():
+    generator = random.Random(5)
+    queries = randomSequences(generator, 5, "query")
+    targets = randomSequences(generator, 7, "target")
+    for algorithm in (Algorithm.NeedlemanWunsch, Algorithm.SmithWaterman):
+        for settings in (
+            dict(),
+            dict(blosum=True, gap=-4),
+            dict(gapOpen=-5, gapExtend=-1),
+            dict(gapOpen=-2, gapExtend=-4),
+        ):
+            scores, aligned = (
+                BatchAligner(algorithm, alignments=alignments, chunkSize=3, **settings)
+                for alignments in (False, True)
+            )
+            for others in (targets, None):
+                expected = list(aligned.run(queries, others))
+                results = list(scores.run(queries, others))
+                assert [(r.query, r.target, r.score) for r in results] == [
+                    (r.query, r.target, r.score) for r in expected
+                ]
+
+
+def test_resume_only_aligns_the_pairs_left(tmp_path):
+    generator = random.Random(6)
+    queries = randomSequences(generator, 4, "query")
+    targets = randomSequences(generator, 5, "target")
+    output = str(tmp_path / "pairs.tsv")
+    aligner = BatchAligner(alignments=True, chunkSize=2)
+    complete = list(aligner.run(queries, targets, output))
+    with open(output) as f:
+        content = f.read()
+
+    # a killed run: the header, 7 rows and a part of the next one
+    lines = content.splitlines(keepends=True)
+    header = len(aligner.getHeader(len(queries), len(targets)).splitlines())
+    with open(output, "w") as f:
+        f.writelines(lines[: header + 7])
+        f.write(lines[header + 7][:5])
+
+    aligned = []
+    alignTargets = aligner.alignTargets
+
+    def countingAlignTargets(query, others):
+        aligned.extend((query.id, target.id) for target in others)
+        return alignTargets(query, others)
+
+    aligner.alignTargets = countingAlignTargets
+    resumed = list(aligner.run(queries, targets, output))
+    assert resumed == complete[7:]
+    assert aligned == [(result.query, result.target) for result in complete[7:]]
+    with open(output) as f:
+        assert f.read() == content
+
+    # a finished batch aligns nothing
+    aligned.clear()
+    assert list(aligner.run(queries, targets, output)) == []
+    assert aligned == []
@@ -0,0 +1,39 @@
+from src.benchmark import randomFamily
+from src.cache import ScoreCache
+from src.msa import Algorithm, Msa
+
+SETTINGS = [
+    dict(),
+    dict(band=1),
+    dict(gap=-2),
+    dict(match=2, mismatch=-2),
+    dict(blosum=False),
+    dict(gapOpen=-5, gapExtend=-1),
+    dict(linearSpace=True),
+    dict(algorithm=Algorithm.SmithWaterman),
+]
+
+
+def scores(family, **settings):
+    settings.setdefault("algorithm", Algorithm.NeedlemanWunsch)
+    msa = Msa(family, **settings)
+    msa.generateScoreMatrix()
+    return {(first.id, second.id): score for (first, second), score in msa.scoreMatrix}
+
+
+def test_settings_never_share_cache_entries(tmp_path):
+    family = randomFamily(5, 60)
+    pairs = len(family) * (len(family) - 1) // 2
+    cache = ScoreCache(str(tmp_path / "scores.sqlite"))
+    for settings in SETTINGS:
+        hits = cache.hits
+        assert scores(family, cache=cache, **settings) == scores(family, **settings)
+        assert cache.hits == hits
+    assert cache.getSize() == pairs * len(SETTINGS)
+
+    # the same settings again are only read from the cache
+    for settings in SETTINGS:
+        misses = cache.misses
+        assert scores(family, cache=cache, **settings) == scores(family, **settings)
+        assert cache.misses == misses
+    cache.close()
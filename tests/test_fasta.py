@@ -0,0 +1,108 @@
+import os
+import random
+import struct
+import zlib
+
+from src.fasta import IndexedFasta, buildFastaIndex, iterFasta
+
+
+def fastaContent(records, width, newline=b"\n"):
+    content = b""
+    for name, residues in records:
+        content += b">" + name.encode() + b" description" + newline
+        for start in range(0, len(residues), width):
+            content += residues[start : start + width].encode() + newline
+    return content
+
+
+def bgzip(content, blockSize):
+    # bgzip blocks: gzip members with the size of the block in a BC extra field
+    blocks = b""
+    for start in range(0, len(content), blockSize):
+        data = content[start : start + blockSize]
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        deflated = compressor.compress(data) + compressor.flush()
+        size = 18 + len(deflated) + 8
+        blocks += struct.pack(
+            "<4BI2BH2BHH", 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, size - 1
+        )
+        blocks += deflated + struct.pack("<II", zlib.crc32(data), len(data))
+    return blocks
+
+
+def randomRecords(generator):
+    return [
+        (f"seq{index}", "".join(generator.choices("ACDEFGHIKLMNPQRSTVWY", k=length)))
+        for index, length in enumerate(generator.choices(range(0, 300), k=6))
+    ]
+
+
+def assertRandomSlices(generator, fasta, records):
+    assert fasta.getIds() == [name for name, _ in records]
+    for name, residues in records:
+        assert fasta.getLength(name) == len(residues)
+        assert fasta.getSequence(name).sequence == residues
+        assert fasta.getSequence(name).id == f"{name} description"
+        for _ in range(50):
+            start = generator.randint(0, len(residues))
+            stop = generator.randint(start, len(residues) + 5)
+            assert bytes(fasta.getSlice(name, start, stop)) == (
+                residues[start:stop].encode()
+            )
+        region = fasta.getRegion(name, 3, 40)
+        assert region.sequence == residues[3:40]
+        assert region.id == f"{name}:4-40"
+
+
+def test_indexed_slices_across_lines(tmp_path):
+    generator = random.Random(3)
+    for newline in (b"\n", b"\r\n"):
+        records = randomRecords(generator)
+        path = tmp_path / "family.fasta"
+        path.write_bytes(fastaContent(records, generator.randint(1, 70), newline))
+        fasta = IndexedFasta(str(path))
+        assertRandomSlices(generator, fasta, records)
+        fasta.close()
+        os.remove(fasta.indexFile)
+
+
+def test_indexed_slices_across_bgzip_blocks(tmp_path):
+    generator = random.Random(4)
+    records = randomRecords(generator)
+    content = fastaContent(records, 60)
+    path = tmp_path / "family.fasta.gz"
+    # blocks much smaller than the records, so that most slices read several blocks
+    path.write_bytes(bgzip(content, 97))
+    assert [(sequence.id, sequence.sequence) for sequence in iterFasta(str(path))] == [
+        (f"{name} description", residues) for name, residues in records
+    ]
+    fasta = IndexedFasta(str(path))
+    assertRandomSlices(generator, fasta, records)
+    fasta.close()
+
+
+def test_stale_index_rebuilt(tmp_path):
+    path = tmp_path / "family.fasta"
+    path.write_bytes(fastaContent([("first", "ACDE" * 20)], 30))
+    indexFile = buildFastaIndex(str(path))
+    with open(indexFile) as f:
+        header = f.readline()
+
+    # same size, only the modification time tells that the file changed
+    residues = "WYVT" * 20
+    path.write_bytes(fastaContent([("other", residues)], 30))
+    status = os.stat(path)
+    os.utime(path, ns=(status.st_atime_ns, status.st_mtime_ns + 10**9))
+    fasta = IndexedFasta(str(path))
+    assert fasta.getIds() == ["other"]
+    assert bytes(fasta.getSlice("other", 25, 35)) == residues[25:35].encode()
+    fasta.close()
+    with open(indexFile) as f:
+        assert f.readline() != header
+
+    # an up to date index is read as is
+    with open(indexFile, "a") as f:
+        f.write("extra\t1\t0\t1\t2\n")
+    fasta = IndexedFasta(str(path))
+    assert fasta.getIds() == ["other", "extra"]
+    fasta.close()
@@ -0,0 +1,116 @@
+import os
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+from src.BLOSUM import GAP_CODE, scoreTable
+from src.benchmark import randomFamily
+from src.msa import Algorithm, GuideTree, Msa
+
+
+def test_add_sequences_to_msa_never_aligned():
+    family = randomFamily(6, 40)
+    msa = Msa(family[:4], Algorithm.NeedlemanWunsch)
+    msa.addSequences(family[4:])
+
+    aligned = msa.alignment
+    assert {sequence.id for sequence in aligned.sequences} == {
+        sequence.id for sequence in family
+    }
+    # rows of the alignment are the sequences with gaps
+    for row in aligned.sequences:
+        original = next(sequence for sequence in family if sequence.id == row.id)
+        assert row.sequence.replace("-", "") == original.sequence
+        assert row.getLength() == aligned.getLength()
+
+
+def test_sum_of_pairs_with_affine_gaps():
+    msa = Msa(randomFamily(6, 40), Algorithm.NeedlemanWunsch, gapOpen=-5, gapExtend=-1)
+    msa.align()
+    report = msa.refine(iterations=10)
+
+    table = scoreTable(msa.match, msa.mismatch, msa.blosum)
+    expected = 0
+    for first, second in combinations(msa.alignment.getMatrix(), 2):
+        previous = None
+        for a, b in zip(first, second):
+            if a == GAP_CODE and b == GAP_CODE:
+                continue
+            if a != GAP_CODE and b != GAP_CODE:
+                expected += table[a, b]
+                previous = None
+                continue
+            state = a == GAP_CODE
+            expected += msa.gapExtend if state == previous else msa.gapOpen
+            previous = state
+    # the gaps kept by refine are the ones counted again
+    assert msa.getSumOfPairs() == report.finalScore == expected
+
+
+def test_refine_before_align():
+    msa = Msa(randomFamily(3, 20), Algorithm.NeedlemanWunsch)
+    with pytest.raises(ValueError):
+        msa.refine()
+
+
+def test_affine_gaps_refuse_band_and_linear_space():
+    family = randomFamily(3, 20)
+    for settings in (dict(band=4), dict(linearSpace=True)):
+        with pytest.raises(ValueError):
+            Msa(family, Algorithm.NeedlemanWunsch, gapOpen=-5, gapExtend=-1, **settings)
+
+
+def test_distance_file_resumed_only_for_same_settings(tmp_path):
+    family = randomFamily(8, 40)
+    path = str(tmp_path / "distances")
+
+    def distances(**settings):
+        msa = Msa(
+            family,
+            Algorithm.NeedlemanWunsch,
+            guideTree=GuideTree.Upgma,
+            distanceFile=path,
+            **settings,
+        )
+        return np.array(msa.generateDistanceMatrix())
+
+    first = distances(gap=-7)
+    # a file of other settings, with the same size, is computed again
+    assert not np.array_equal(distances(gap=-1), first)
+    assert np.array_equal(distances(gap=-7), first)
+
+    # an interrupted file is completed with the missing distances only
+    with open(path, "r+b") as file:
+        file.seek(os.path.getsize(path) - 4)
+        file.write(np.float32(np.nan).tobytes())
+    assert np.array_equal(distances(gap=-7), first)
+
+
+def test_distance_file_unchanged_by_the_tree(tmp_path, monkeypatch):
+    family = randomFamily(8, 40)
+    path = str(tmp_path / "distances")
+    for guideTree in GuideTree:
+        msa = Msa(
+            family, Algorithm.NeedlemanWunsch, guideTree=guideTree, distanceFile=path
+        )
+        msa.generateDistanceMatrix()
+        with open(path, "rb") as file:
+            written = file.read()
+        msa.generateGuideTree()
+        with open(path, "rb") as file:
+            assert file.read() == written
+        # the scratch copy of the tree is removed
+        assert os.listdir(tmp_path) == ["distances"]
+
+    # the file is resumed without scoring any pair
+    def fail(*args):
+        raise AssertionError("a pair was scored")
+
+    monkeypatch.setattr(Msa, "_Msa__scorePairs", fail)
+    msa = Msa(
+        family, Algorithm.NeedlemanWunsch, guideTree=GuideTree.Upgma, distanceFile=path
+    )
+    msa.generateGuideTree()
+    leaves = [node.sequence for node in msa.tree.postOrder() if node.isLeaf()]
+    assert sorted(map(id, leaves)) == sorted(map(id, family))
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from src.benchmark import randomFamily
+from src.BLOSUM import GAP_CODE, PROFILE_SIZE, encode, scoreTable
+from src.msa import Algorithm, Msa
+from src.sequence import GroupSequences, Sequence
+
+
+def test_rows_are_views_of_the_matrix():
+    group = GroupSequences([Sequence("a", "AC-D"), Sequence("b", "A-CD")])
+    matrix = group.getMatrix()
+    assert [row.sequence for row in group.sequences] == ["AC-D", "A-CD"]
+    assert all(np.shares_memory(row.getEncoded(), matrix) for row in group.sequences)
+    assert group.getColumnCounts()[GAP_CODE].tolist() == [0, 1, 1, 0]
+
+    group.setFromMatrix(matrix[::-1, 1:])
+    assert [row.id for row in group.sequences] == ["a", "b"]
+    assert [row.sequence for row in group.sequences] == ["-CD", "C-D"]
+    assert group.getColumnCounts()[encode("D")[0]].tolist() == [0, 0, 2]
+
+
+def test_members_not_aligned_have_no_matrix():
+    group = GroupSequences([Sequence("a", "ACD"), Sequence("b", "AC")])
+    assert [row.sequence for row in group.sequences] == ["ACD", "AC"]
+    with pytest.raises(ValueError):
+        group.getMatrix()
+
+
+def test_profiles_are_small_and_freed_after_the_pairwise_stage():
+    family = randomFamily(4, 30)
+    profile = family[0].getProfile(1, -1, True)
+    assert profile.dtype == np.int16
+    assert np.array_equal(
+        profile, scoreTable(1, -1, True)[:PROFILE_SIZE, family[0].getEncoded()]
+    )
+    assert family[0].getProfile(1, -1, True) is profile
+
+    Msa(family, Algorithm.NeedlemanWunsch).generateScoreMatrix()
+    assert family[0].getProfile(1, -1, True) is not profile
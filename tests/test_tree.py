@@ -0,0 +1,76 @@
+from itertools import combinations
+
+import numpy as np
+
+from src.sequence import Sequence
+from src.tree import neighborJoining, upgma
+
+
+def test_upgma_same_tree_as_square_matrix():
+    rng = np.random.default_rng(0)
+    for size in range(1, 30):
+        sequences = [Sequence(f"s{index}", "A") for index in range(size)]
+        distances = rng.random(size * (size - 1) // 2)
+        square = np.full((size, size), np.inf)
+        square[np.triu_indices(size, 1)] = distances
+        square = np.minimum(square, square.T)
+
+        # naive UPGMA on the square matrix
+        clusters = {index: (sequences[index].id, 1, 0.0) for index in range(size)}
+        while len(clusters) > 1:
+            _, first, second = min(
+                (square[first, second], first, second)
+                for first, second in combinations(sorted(clusters), 2)
+            )
+            firstText, firstSize, firstHeight = clusters[first]
+            secondText, secondSize, secondHeight = clusters.pop(second)
+            height = square[first, second] / 2
+            clusters[first] = (
+                f"({firstText}:{height - firstHeight:.6g},"
+                f"{secondText}:{height - secondHeight:.6g})",
+                firstSize + secondSize,
+                height,
+            )
+            square[first] = square[:, first] = (
+                firstSize * square[first] + secondSize * square[second]
+            ) / (firstSize + secondSize)
+        assert upgma(distances, sequences).toNewick() == clusters[0][0] + ";"
+
+
+def test_neighbor_joining_recovers_additive_distances():
+    rng = np.random.default_rng(1)
+    for size in range(3, 30):
+        # random tree: groups are joined by branches of random lengths, the distance of
+        # two leaves is the length of the path between them
+        heights = rng.uniform(0.1, 1, size)
+        square = np.zeros((size, size))
+        groups = [[index] for index in range(size)]
+        while len(groups) > 1:
+            first = groups.pop(rng.integers(len(groups)))
+            second = groups.pop(rng.integers(len(groups)))
+            for group in (first, second):
+                heights[group] += rng.uniform(0.1, 1)
+            for a in first:
+                square[a, second] = square[second, a] = heights[a] + heights[second]
+            groups.append(first + second)
+        sequences = [Sequence(str(index), "A") for index in range(size)]
+        root = neighborJoining(square[np.triu_indices(size, 1)], sequences)
+
+        # distances along the tree built, from each node down to its leaves
+        down, built = {}, np.zeros((size, size))
+        for node in root.postOrder():
+            if node.isLeaf():
+                down[id(node)] = {int(node.sequence.id): 0.0}
+                continue
+            left, right = (
+                {
+                    leaf: distance + child.length
+                    for leaf, distance in down[id(child)].items()
+                }
+                for child in (node.left, node.right)
+            )
+            for a, first in left.items():
+                for b, second in right.items():
+                    built[a, b] = built[b, a] = first + second
+            down[id(node)] = {**left, **right}
+        assert np.allclose(built, square)